@@ -17,103 +17,195 @@
 #
 #
 
-from tika import parser
+from metadata_cache import MetadataCache, DEFAULT_CACHE
+from corpus import Corpus
+from tika_client import TikaClient
 from vector import Vector
-from random import randint
+from cosine_matrix import featureMatrix
+from random import randint, random
+from scipy import sparse
+import numpy as np
 import argparse, os, csv, itertools, copy, json, sys
 
-union_features = set()
+def squared_distances(features, sqNorms, centroids):
+    '''
+    n x k squared Euclidean distances of the rows of the sparse feature
+    matrix to the dense centroids, as |x|^2 - 2 x.c + |c|^2
+    '''
+    distances = np.asarray(features.dot(centroids.T)) * -2.0
+    distances += sqNorms[:, np.newaxis]
+    distances += (centroids ** 2).sum(axis=1)
+    np.maximum(distances, 0.0, out=distances)
+    return distances
 
-def filterFiles(inputDir, acceptTypes):
-    filename_list = []
 
-    for root, dirnames, files in os.walk(inputDir):
-        dirnames[:] = [d for d in dirnames if not d.startswith('.')]
-        for filename in files:
-            if not filename.startswith('.'):
-                filename_list.append(os.path.join(root, filename))
+def compute_means(features, labels, no_centroids):
+    '''
+    Mean of the rows of every cluster, as one grouped (indicator matrix) sum
+    '''
+    n = features.shape[0]
+    indicator = sparse.csr_matrix((np.ones(n), (labels, np.arange(n))), shape=(no_centroids, n))
+    counts = np.bincount(labels, minlength=no_centroids).astype(np.float64)
+    return indicator.dot(features).toarray() / counts[:, np.newaxis]
 
-    filename_list = (filename for filename in filename_list if parser.from_file(filename))
-    if acceptTypes:
-        filename_list = (filename for filename in filename_list if str(parser.from_file(filename)['metadata']['Content-Type'].encode('utf-8')).split('/')[-1] in acceptTypes)
-    else:
-        print "Accepting all MIME Types....."
 
-    return filename_list
+def same_partition(labels, new_labels):
+    '''
+    True if both labellings group the points identically
+    '''
+    pairs = np.unique(labels * (new_labels.max() + 1) + new_labels).size
+    return pairs == np.unique(labels).size == np.unique(new_labels).size
 
 
-def compute_Mean(list_of_points):
+def kmeans_plus_plus(features, sqNorms, no_centroids):
+    '''
+    k-means++ seeding: after a uniform first pick, each centroid is drawn
+    with probability proportional to the squared distance of a point to
+    its nearest centroid so far
+    @return row indices of the chosen points
+    '''
+    n = features.shape[0]
+    chosen = [randint(0, n - 1)]
+    nearest = squared_distances(features, sqNorms, features[chosen[0]].toarray()).ravel()
 
-    new_centroid = Vector()
-    for feature in union_features:
+    while len(chosen) < no_centroids:
+        total = nearest.sum()
+        if total > 0:
+            pick = int(np.searchsorted(np.cumsum(nearest), random() * total, side='right'))
+            if pick >= n or nearest[pick] == 0:     # rounding at the far end
+                pick = int(np.flatnonzero(nearest)[-1])
+        else:       # every point coincides with a centroid already
+            pick = randint(0, n - 1)
 
-        dimension_sum = 0.0
-        for point in list_of_points:
-            try:
-                dimension_sum += point.features[feature]
-            except KeyError:
-                continue                
-        new_centroid.features[feature] = float(dimension_sum)/len(list_of_points)
+        chosen.append(pick)
+        nearest = np.minimum(nearest, squared_distances(features, sqNorms, features[pick].toarray()).ravel())
 
-    return new_centroid
+    return chosen
 
 
-def cluster_assignment(list_of_points, centroids):
+def K_Means(features, no_centroids, maxIterations=300, tolerance=0.0, init="random", sqNorms=None):
     '''
-    Assign points to nearest centroid 
+    One Lloyd k-means run over a sparse document-feature matrix
+    (see cosine_matrix.featureMatrix)
+    @param maxIterations upper bound on reassignment iterations
+    @param tolerance also stop once an iteration improves the distortion by
+           less than this (default: only stop when assignments stop changing)
+    @param init "random" picks the initial centroids uniformly, "kmeans++"
+           spreads them out with k-means++ seeding
+    @param sqNorms squared row norms of features, to reuse across runs
+    @return [distortion, {cluster: [row indices]}, iterations used]
     '''
-    clusters = {}
-    for point in list_of_points:
+    n = features.shape[0]
+    if sqNorms is None:
+        sqNorms = np.asarray(features.multiply(features).sum(axis=1)).ravel()
 
-        distances = []
-        for centroid in centroids:
-            distances.append(point.euclidean_dist(centroid))
+    if init == "kmeans++":
+        seeds = kmeans_plus_plus(features, sqNorms, no_centroids)
+    else:
+        seeds = [randint(0, n - 1) for i in range(no_centroids)]
 
-        try:
-            clusters[distances.index(min(distances))].append(point)
-        except KeyError:
-            clusters[distances.index(min(distances))] = []
-            clusters[distances.index(min(distances))].append(point)
-                 
-    return clusters
+    centroids = features[seeds].toarray()
+    labels = squared_distances(features, sqNorms, centroids).argmin(axis=1)
+    
+    distortion = None
+    for iterations in range(1, max(maxIterations, 1) + 1):
+        # clusters left empty are dropped, the others renumbered in order
+        keys, labels = np.unique(labels, return_inverse=True)
+        centroids = compute_means(features, labels, len(keys))
+        distances = squared_distances(features, sqNorms, centroids)
+        new_labels = distances.argmin(axis=1)
+
+        # unchanged assignments give unchanged means: a fixed point
+        converged = same_partition(labels, new_labels)
+        labels = new_labels
+        if converged:
+            break
+
+        if tolerance > 0:
+            new_distortion = np.sqrt(distances[np.arange(n), labels]).mean()
+            if distortion is not None and distortion - new_distortion < tolerance:
+                break
+            distortion = new_distortion
+    
+    distortion = float(np.sqrt(distances[np.arange(n), labels]).mean())
+
+    clusters = {}
+    for index, label in enumerate(labels):
+        clusters.setdefault(int(label), []).append(index)
 
+    return [distortion, clusters, iterations]
+    
 
-def move_centroid(clusters):
+def assign_all(features, sqNorms, centroids, chunkRows=65536):
+    '''
+    Nearest centroid and its squared distance for every row, a chunk of
+    rows at a time so only chunkRows x k distances are held at once
     '''
-    Shift centroid to mean of assigned points
+    n = features.shape[0]
+    labels = np.empty(n, dtype=np.int64)
+    nearest = np.empty(n)
+    for start in range(0, n, chunkRows):
+        stop = min(start + chunkRows, n)
+        distances = squared_distances(features[start:stop], sqNorms[start:stop], centroids)
+        labels[start:stop] = distances.argmin(axis=1)
+        nearest[start:stop] = distances[np.arange(stop - start), labels[start:stop]]
+    return labels, nearest
+
+
+def K_Means_minibatch(features, no_centroids, batchSize, maxIterations=300, shiftTolerance=0.0, init="random", sqNorms=None):
     '''
-    new_centroids = []
-    for key in clusters:
-        new_centroids.append(compute_Mean(clusters[key]))
+    Mini-batch k-means: every iteration only assigns batchSize random rows,
+    and moves each centroid towards the mean of its batch members with a
+    per-centroid learning rate of 1 / (points it has seen so far). Every
+    row is only assigned once, after the last batch.
+    @param maxIterations number of batches
+    @param shiftTolerance also stop once no centroid moves further than this
+           (a Euclidean distance in feature space)
+    @return [distortion, {cluster: [row indices]}, iterations used]
+    '''
+    if batchSize < 1:
+        raise ValueError("batchSize must be at least 1, got " + str(batchSize))
+    n = features.shape[0]
+    if sqNorms is None:
+        sqNorms = np.asarray(features.multiply(features).sum(axis=1)).ravel()
+
+    if init == "kmeans++":
+        seeds = kmeans_plus_plus(features, sqNorms, no_centroids)
+    else:
+        seeds = [randint(0, n - 1) for i in range(no_centroids)]
 
-    return new_centroids
+    centroids = features[seeds].toarray()
+    seen = np.zeros(no_centroids)
+    batches = np.random.RandomState(randint(0, 2**31 - 1))
 
+    for iterations in range(1, max(maxIterations, 1) + 1):
+        batch = batches.randint(0, n, min(batchSize, n))
+        rows = features[batch]
+        labels = squared_distances(rows, sqNorms[batch], centroids).argmin(axis=1)
 
-def K_Means(list_of_points, no_centroids):
-    
-    centroids = []
-    for i in range(no_centroids):
-        centroids.append(Vector())
+        # the per-point updates c += (x - c) / seen, summed over the batch
+        counts = np.bincount(labels, minlength=no_centroids).astype(np.float64)
+        indicator = sparse.csr_matrix((np.ones(len(batch)), (labels, np.arange(len(batch)))), shape=(no_centroids, len(batch)))
+        sums = indicator.dot(rows).toarray()
 
-    for centroid in centroids:
-        random_point = list_of_points[randint(0, (len(list_of_points)-1) )]
-        centroid.features = copy.deepcopy(random_point.features)
+        moved = counts > 0
+        seen += counts
+        new_centroids = centroids.copy()
+        new_centroids[moved] += (sums[moved] - counts[moved, np.newaxis] * centroids[moved]) / seen[moved, np.newaxis]
 
-    
-    clusters = cluster_assignment(list_of_points, centroids)
-    
-    for i in range(0, 300):             # iterate until convergence, default 300
-        centroids = move_centroid(clusters)
+        shift = np.sqrt(((new_centroids - centroids) ** 2).sum(axis=1)).max()
+        centroids = new_centroids
+        if shiftTolerance > 0 and shift < shiftTolerance:
+            break
 
-        clusters = cluster_assignment(list_of_points, centroids)
-    
-    distortion_sum = 0.0
-    for key in clusters:
-        for point in clusters[key]:
-            distortion_sum += point.euclidean_dist(centroids[key])
-    distortion = distortion_sum / float(len(list_of_points))
+    labels, nearest = assign_all(features, sqNorms, centroids)
+    distortion = float(np.sqrt(nearest).mean())
 
-    return [distortion, clusters]
+    clusters = {}
+    for index, label in enumerate(labels):
+        clusters.setdefault(int(label), []).append(index)
+
+    return [distortion, clusters, iterations]
     
 
 if __name__ == "__main__":
@@ -123,25 +215,65 @@ if __name__ == "__main__":
     argParser.add_argument('--outJSON', required=True, help='/path/to/clusters.json containing k-means cluster assignments')
     argParser.add_argument('--Kvalue', required=True, help='number of clusters to find')
     argParser.add_argument('--accept', nargs='+', type=str, help='Optional: compute similarity only on specified IANA MIME Type(s)')
+    argParser.add_argument('--cache', default=DEFAULT_CACHE, help='Optional: path to the Tika metadata cache (default: %(default)s)')
+    argParser.add_argument('--tikaServer', help='Optional: URL of the Tika server (default: local tika-python server)')
+    argParser.add_argument('--tikaWorkers', type=int, default=4, help='Optional: number of concurrent Tika requests (default: %(default)s)')
+    argParser.add_argument('--tikaTimeout', type=float, default=300, help='Optional: seconds to wait for Tika to answer a request before retrying (default: %(default)s)')
+    argParser.add_argument('--maxIterations', type=int, default=300, help='Optional: maximum reassignment iterations of each k-means run (default: %(default)s)')
+    argParser.add_argument('--tolerance', type=float, default=0.0, help='Optional: stop a run once the distortion improves by less than this (default: stop when assignments stop changing; not used with --batchSize)')
+    argParser.add_argument('--shiftTolerance', type=float, default=0.0, help='Optional: with --batchSize, stop a run once no centroid moves further than this distance (default: run all --maxIterations batches)')
+    argParser.add_argument('--init', choices=['random', 'kmeans++'], default='random', help='Optional: choice of the initial centroids (default: %(default)s)')
+    argParser.add_argument('--restarts', type=int, default=51, help='Optional: number of random restarts (default: %(default)s)')
+    argParser.add_argument('--patience', type=int, help='Optional: stop the restarts once the best distortion has not improved over PATIENCE runs')
+    argParser.add_argument('--batchSize', type=int, help='Optional: run mini-batch k-means on random batches of BATCHSIZE documents, for very large corpora')
     args = argParser.parse_args()
 
+    if args.tikaWorkers < 1:
+        argParser.error('--tikaWorkers must be at least 1')
+    if args.tikaTimeout <= 0:
+        argParser.error('--tikaTimeout must be positive')
+    if args.restarts < 1:
+        argParser.error('--restarts must be at least 1')
+    if args.batchSize is not None and args.batchSize < 1:
+        argParser.error('--batchSize must be at least 1')
+    if args.batchSize and args.tolerance:
+        argParser.error('--tolerance applies to full k-means; use --shiftTolerance with --batchSize')
+    if args.shiftTolerance and not args.batchSize:
+        argParser.error('--shiftTolerance requires --batchSize')
+
     if args.inputDir and args.outJSON and args.Kvalue:
 
-        list_of_points = []
-        for eachFile in filterFiles(args.inputDir, args.accept):
-            list_of_points.append(Vector(eachFile, parser.from_file(eachFile)["metadata"]))
-        
-        for point in list_of_points:
-            union_features |= set(point.features.keys())
+        cache = MetadataCache(args.cache)
+        try:
+            corpus = Corpus(args.inputDir, args.accept, cache, Vector, TikaClient(args.tikaServer, args.tikaWorkers, readTimeout=args.tikaTimeout))
+        finally:
+            cache.close()
+
+        file_metadata = dict(zip(corpus.filenames, corpus.metadata))
+        list_of_points = corpus.vectors
+        features = featureMatrix(list_of_points)[0]
+        sqNorms = np.asarray(features.multiply(features).sum(axis=1)).ravel()
 
         
         #Randomly initialize Centroids for each iteration to find global minima
-        global_minima = K_Means(list_of_points, int(args.Kvalue))
-        for i in range(0, 50):
-            curr_iteration = K_Means(list_of_points, int(args.Kvalue))
-
-            if curr_iteration[0] < global_minima[0]:
+        global_minima = None
+        stale = 0
+        for i in range(0, args.restarts):
+            if args.batchSize:
+                curr_iteration = K_Means_minibatch(features, int(args.Kvalue), args.batchSize, args.maxIterations, args.shiftTolerance, args.init, sqNorms)
+            else:
+                curr_iteration = K_Means(features, int(args.Kvalue), args.maxIterations, args.tolerance, args.init, sqNorms)
+            print "run", i, "converged after", curr_iteration[2], "iterations, distortion", curr_iteration[0]
+
+            if global_minima is None or curr_iteration[0] < global_minima[0]:
                 global_minima = curr_iteration
+                stale = 0
+            else:
+                stale += 1
+
+            if args.patience and stale >= args.patience:
+                print "no improvement over the last", args.patience, "runs, stopping after", i + 1, "runs"
+                break
         
 
         with open(args.outJSON, "w") as jsonF:
@@ -151,10 +283,11 @@ if __name__ == "__main__":
 
                 cluster_Dict = {}
                 children = []
-                for point in global_minima[1][key]:
+                for index in global_minima[1][key]:
 
+                    point = list_of_points[index]
                     node = {}
-                    node["metadata"] = json.dumps(parser.from_file(point.filename)["metadata"])
+                    node["metadata"] = json.dumps(file_metadata[point.filename])
                     node["name"] = point.filename.split('/')[-1]
                     node["path"] = point.filename
                     children.append(node)
@@ -19,85 +19,154 @@
 
 import json
 import sys
-import ast
+import argparse
+from collections import Counter, deque
+from itertools import islice
+from multiprocessing import Pool
+from similarity_scores import scoresPath, lineParser, metadataDict
+
+default_threshold = 0.01
+
+
+class KeyCounts:
+    '''
+    Number of files carrying each metadata key, keys kept in first-seen order.
+
+    Counts of consecutive runs of files are combined with merge(), so a
+    cluster can be counted in pieces, e.g. by several processes.
+    '''
+
+    def __init__(self):
+        self.counts = Counter()
+        self.order = []
+
+
+    def add(self, metadata):
+        for key in metadata:
+            if key not in self.counts:
+                self.order.append(key)
+            self.counts[key] += 1
+
+
+    def merge(self, other):
+        '''
+        Add the counts of other, whose files follow the ones counted here
+        '''
+        for key in other.order:
+            if key not in self.counts:
+                self.order.append(key)
+            self.counts[key] += other.counts[key]
+
+
+    def children(self):
+        return [{"name":key, "size":self.counts[key]} for key in self.order]
+
+
+def circle(metadataLists):
+    '''
+    Circle packing children of one cluster
+    @param metadataLists metadata dict of each file of the cluster
+    '''
+    counts = KeyCounts()
+    for metadata in metadataLists:
+        counts.add(metadata)
+    return counts.children()
+
+
+def _packChunk(task):
+    '''
+    Split a chunk of score file lines at the cluster boundaries it contains
+    @return (first score, last score, KeyCounts of each run), or None when
+            the chunk has no entries
+    '''
+    lines, parse, threshold = task
+    runs = []
+    first = prior = None
+    for line in lines:
+        entry = parse(line)
+        if entry is None:
+            continue
+        score = entry["score"]
+        if prior is None:
+            first = score
+            runs.append(KeyCounts())
+        elif prior-score > threshold:
+            runs.append(KeyCounts())
+        runs[-1].add(metadataDict(entry))
+        prior = score
+    return (first, prior, runs) if runs else None
+
+
+def readChunks(f, chunkSize):
+    while True:
+        lines = list(islice(f, chunkSize))
+        if not lines:
+            return
+        yield lines
+
+
+def packChunks(path, threshold, workers=1, chunkSize=10000):
+    '''
+    Stream the _packChunk results of consecutive chunkSize-line chunks of
+    path in file order; with workers > 1 at most 2 x workers are in flight
+    '''
+    parse = lineParser(path)
+    with open(path) as f:
+        tasks = ((lines, parse, threshold) for lines in readChunks(f, chunkSize))
+
+        if workers <= 1:
+            for task in tasks:
+                yield _packChunk(task)
+            return
+
+        pool = Pool(workers)
+        try:
+            pending = deque()
+            for task in tasks:
+                pending.append(pool.apply_async(_packChunk, (task,)))
+                if len(pending) >= 2 * workers:
+                    yield pending.popleft().get()
+            while pending:
+                yield pending.popleft().get()
+        finally:
+            pool.terminate()
+
+
+def packClusters(path, threshold=default_threshold, workers=1, chunkSize=10000):
+    '''
+    KeyCounts of every cluster of a score file. A new cluster starts where
+    the score drops by more than threshold, including across chunks.
+    '''
+    clusters = []
+    prior = None
+    for chunk in packChunks(path, threshold, workers, chunkSize):
+        if chunk is None:
+            continue
+        first, last, runs = chunk
+        if prior is not None and prior-first <= threshold:
+            clusters[-1].merge(runs[0])
+            runs = runs[1:]
+        clusters.extend(runs)
+        prior = last
+    return clusters or [KeyCounts()]
 
 
 def main(argv = None):
-    threshold = 0.01
-    with open("similarity-scores.txt") as f:
-        prior = None
-        clusters = []
-        clusterCount = 0
-        cluster = {"name":"cluster"+str(clusterCount)}
-        clusterData = []
-        for line in f:
-            if "Resemblance" in line:
-                continue
-            featureDataList = line.split("{", 1)
-            metadata = '{' + featureDataList[1]
-            featureDataList = featureDataList[0].rsplit(",", 3)
-            featureDataList.remove('')
-            featureDataList[2] = metadata
-
-            if len(featureDataList) != 3:
-                continue
-            if prior != None:
-                diff = prior-float(featureDataList[1])
-            else:
-                diff = -1.0
-
-            # cleanse the \n
-            featureDataList[1] = featureDataList[1].strip()
-            #featureData = {"name":featureDataList[0], "score":float(featureDataList[1]), "metadata" : featureDataList[2]}
-
-            if diff > threshold:
-                cluster["children"] = circle(clusterData)
-                clusters.append(cluster)
-                clusterCount = clusterCount + 1
-                cluster = {"name":"cluster"+str(clusterCount)}
-                clusterData = []
-                clusterData.append(featureDataList[2])
-                prior = float(featureDataList[1])
-            else:
-                clusterData.append(featureDataList[2])
-                prior = float(featureDataList[1])
-
-        #add the last cluster into clusters
-        cluster["children"] = circle(clusterData)
-        clusters.append(cluster)
-        clusterCount = clusterCount + 1
-        cluster = {"name":"cluster"+str(clusterCount)}
-
-    clusterStruct = {"name":"clusters", "children":clusters}
-    with open("circle.json", "w") as f:
-        f.write(json.dumps(clusterStruct, sort_keys=True, indent=4, separators=(',', ': ')))
+    argParser = argparse.ArgumentParser('Circle packing of the metadata keys of each similarity cluster')
+    argParser.add_argument('--workers', type=int, default=1, help='Optional: processes counting chunks of the score file (default: %(default)s)')
+    argParser.add_argument('--chunkSize', type=int, default=10000, help='Optional: score file lines per chunk (default: %(default)s)')
+    args = argParser.parse_args(argv)
+    if args.workers < 1:
+        argParser.error('--workers must be at least 1')
+    if args.chunkSize < 1:
+        argParser.error('--chunkSize must be at least 1')
 
+    clusters = packClusters(scoresPath(), default_threshold, args.workers, args.chunkSize)
 
-def circle( metadataLists) : 
-    metadataList = []
-    circles = set()
-    for line in metadataLists:
-        metadata = ast.literal_eval(line)
-        for item in metadata.keys():
-            if item not in circles :
-                circles.add(item)
-                circle = {}
-                circle["name"] = item
-                circle["size"] = 1
-                metadataList.append(circle)
-            else :
-                for value in metadataList:
-                    if item  == value["name"]:
-                        count = value["size"]
-                        index = metadataList.index(value)
-                        metadataList.remove(value)
-                        circle = {}
-                        circle["name"] = item
-                        circle["size"] = count +1
-                        metadataList.insert(index, circle)
-    return metadataList
+    clusterStruct = {"name":"clusters", "children":[{"name":"cluster"+str(i), "children":counts.children()}
+                                                    for i, counts in enumerate(clusters)]}
+    with open("circle.json", "w") as f:
+        f.write(json.dumps(clusterStruct, sort_keys=True, indent=4, separators=(',', ': ')))
 
 if __name__ == "__main__":
     sys.exit(main())
-
-
@@ -23,57 +23,43 @@ except ImportError:
     import json
 
 import sys
+from similarity_scores import readScores, metadataText, displayText
 
 default_threshold = 0.01
 
 usage = "Usage: python cluster-scores.py [-t threshold_value]"
 
 def main(threshold):
-    with open("similarity-scores.txt") as f:
-        prior = None
-        clusters = []
-        clusterCount = 0
-        cluster = {"name":"cluster"+str(clusterCount)}
-        clusterData = []
-        for line in f:
-            if line.find("{") != -1:
-                featureDataList = line.split(",",3) # file name,score,metadata
-            else :
-                featureDataList = line.split(",", 2)
+    prior = None
+    clusters = []
+    clusterCount = 0
+    cluster = {"name":"cluster"+str(clusterCount)}
+    clusterData = []
+    for entry in readScores():
+        score = entry["score"]
 
-            if not (len(featureDataList) == 3 or len(featureDataList) == 4):
-                continue
+        if prior != None:
+            diff = prior-score
+        else:
+            diff = -1.0
 
+        featureData = {"name":displayText(entry["name"]), "score":score, "path":displayText(entry["path"])}
+        metadata = metadataText(entry)
+        if metadata is not None:
+            featureData["metadata"] = metadata
 
-            if prior != None:
-                diff = prior-float(featureDataList[1])
-            else:
-                diff = -1.0
+        if diff > threshold:
+            cluster["children"] = clusterData
+            clusters.append(cluster)
+            clusterCount = clusterCount + 1
+            cluster = {"name":"cluster"+str(clusterCount)}
+            clusterData = []
+        clusterData.append(featureData)
+        prior = score
 
-            # cleanse the \n
-            featureDataList[1] = featureDataList[1].strip()
-            if(len(featureDataList) == 4):
-                featureData = {"name":featureDataList[0], "score":float(featureDataList[1]), "path" :featureDataList[2],  "metadata" : featureDataList[3]}
-            elif (len(featureDataList) == 3):
-                featureData = {"name":featureDataList[0], "score":float(featureDataList[1]), "path" :featureDataList[2]}
-
-            if diff > threshold:
-                cluster["children"] = clusterData
-                clusters.append(cluster)
-                clusterCount = clusterCount + 1
-                cluster = {"name":"cluster"+str(clusterCount)}
-                clusterData = []
-                clusterData.append(featureData)
-                prior = float(featureDataList[1])
-            else:
-                clusterData.append(featureData)
-                prior = float(featureDataList[1])
-
-        #add the last cluster into clusters
-        cluster["children"] = clusterData
-        clusters.append(cluster)
-        clusterCount = clusterCount + 1
-        cluster = {"name":"cluster"+str(clusterCount)}
+    #add the last cluster into clusters
+    cluster["children"] = clusterData
+    clusters.append(cluster)
 
     clusterStruct = {"name":"clusters", "children":clusters}
     with open("clusters.json", "w") as f:
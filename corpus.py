@@ -0,0 +1,88 @@
+#!/usr/bin/env python2.7
+#
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+
+# Loading stage shared by the pairwise scorers and the clusterers
+
+from metadata_cache import MetadataCache
+from tika_client import TikaClient
+import os
+
+def listFiles(inputDir):
+    filename_list = []
+
+    for root, dirnames, files in os.walk(inputDir):
+        dirnames[:] = [d for d in dirnames if not d.startswith('.')]
+        for filename in files:
+            if not filename.startswith('.'):
+                filename_list.append(os.path.join(root, filename))
+
+    return filename_list
+
+
+def mimeSubtype(metadata):
+    return str(metadata['Content-Type'].encode('utf-8')).split('/')[-1]
+
+
+class Corpus:
+    '''
+    Every accepted file of a directory, parsed and vectorized exactly once.
+
+    filenames, metadata and vectors are parallel lists, so a document is
+    addressed by its index everywhere downstream.
+    '''
+
+    def __init__(self, inputDir, acceptTypes=None, cache=None, vectorize=None, client=None):
+        '''
+        Load a corpus
+        @param cache MetadataCache to read through (default: in-memory only)
+        @param vectorize callable(filename, metadata) building the per-document
+               representation; it is given its own copy of the metadata dict
+        @param client TikaClient used for cache misses (default: 4 workers)
+        '''
+        self.filenames = []
+        self.metadata = []
+        self.vectors = []
+
+        if cache is None:
+            cache = MetadataCache(None)
+        if client is None:
+            client = TikaClient()
+
+        if not acceptTypes:
+            print "Accepting all MIME Types....."
+
+        filenames = listFiles(inputDir)
+        cache.fill(filenames, client)
+
+        for filename in filenames:
+            # files Tika rejected, or could not answer for this time, are skipped
+            metadata = cache.get(filename)[1]
+            if metadata is None:
+                continue
+            if acceptTypes and mimeSubtype(metadata) not in acceptTypes:
+                continue
+
+            self.filenames.append(filename)
+            self.metadata.append(metadata)
+            if vectorize:
+                self.vectors.append(vectorize(filename, dict(metadata)))
+
+
+    def __len__(self):
+        return len(self.filenames)
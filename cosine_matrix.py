@@ -0,0 +1,77 @@
+#!/usr/bin/env python2.7
+#
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+
+# All-pairs cosine similarity as sparse matrix products
+
+import numpy as np
+from scipy import sparse
+
+def featureMatrix(vectors, vocabulary=None):
+    '''
+    CSR document-feature matrix of Vector.features, one row per vector.
+    vocabulary maps feature name -> column and is extended in place.
+    '''
+    if vocabulary is None:
+        vocabulary = {}
+
+    indptr = [0]
+    indices = []
+    data = []
+    for vector in vectors:
+        for feature, value in vector.features.iteritems():
+            indices.append(vocabulary.setdefault(feature, len(vocabulary)))
+            data.append(value)
+        indptr.append(len(indices))
+
+    matrix = sparse.csr_matrix((np.array(data, dtype=np.float64), np.array(indices, dtype=np.int32), np.array(indptr, dtype=np.int64)),
+                               shape=(len(vectors), len(vocabulary)))
+    return matrix, vocabulary
+
+
+def normalizeRows(matrix):
+    '''
+    L2-normalize every row; all-zero rows stay zero, so they score 0
+    against everything like Vector.cosTheta in vector_ext
+    '''
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    return sparse.diags(1.0 / norms).dot(matrix).tocsr()
+
+
+class CosineMatrix:
+    '''
+    Cosine similarity engine over a whole corpus of vectors.
+
+    Rows are normalized once, after which cosTheta of every pair is a
+    single entry of M * M.T, computed one block of rows at a time
+    (see pairwise.upperTriangleBlocks).
+    '''
+
+    def __init__(self, vectors):
+        self.matrix = normalizeRows(featureMatrix(vectors)[0])
+        self.transposed = self.matrix.T.tocsc()
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    def similarities(self, start, stop, colStart=0, colStop=None):
+        '''
+        Dense array of cosTheta for rows start:stop against rows colStart:colStop
+        '''
+        return self.matrix[start:stop].dot(self.transposed[:, colStart:colStop]).toarray()
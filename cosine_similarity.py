@@ -17,57 +17,34 @@
 #
 #
 
-from tika import parser
 from vector import Vector
-import os, itertools, argparse, csv
-from requests import ConnectionError
-from time import sleep 
+from cosine_matrix import CosineMatrix
+from score_manifest import updateScores, checkScores
+from pairwise import writeUpperTriangle, blockRows
+from metadata_cache import MetadataCache, DEFAULT_CACHE
+from corpus import Corpus
+from tika_client import TikaClient
+import argparse
 
-def filterFiles(inputDir, acceptTypes):
-    filename_list = []
 
-    for root, dirnames, files in os.walk(inputDir):
-        dirnames[:] = [d for d in dirnames if not d.startswith('.')]
-        for filename in files:
-            if not filename.startswith('.'):
-                filename_list.append(os.path.join(root, filename))
-    try:
-        filename_list = [filename for filename in filename_list if "metadata" in parser.from_file(filename)]
-    except ConnectionError:
-        sleep(1)
-    if acceptTypes:
-        filename_list = [filename for filename in filename_list if str(parser.from_file(filename)['metadata']['Content-Type'].encode('utf-8')).split('/')[-1] in acceptTypes]
-    else:
-        print "Accepting all MIME Types....."
+def computeScores(inputDir, outCSV, acceptTypes, cache, client, blockSize=None, memoryBudget=None, topK=None, minScore=None, workers=1, incremental=False, outFormat="csv", check=False):
+    '''
+    @param check after an incremental update, rescore every pair and
+           return the number of pairs that differ from the updated CSV
+    '''
 
-    return filename_list
+    corpus = Corpus(inputDir, acceptTypes, cache, Vector, client)
 
+    if incremental:
+        options = {"measure": "cosine", "inputDir": inputDir, "accept": acceptTypes, "minScore": minScore}
+        updateScores(corpus, CosineMatrix, outCSV, options, blockSize, memoryBudget, minScore, workers)
+        if check:
+            return checkScores(corpus, CosineMatrix, outCSV, blockSize, memoryBudget, minScore, workers)
+        return
 
-def computeScores(inputDir, outCSV, acceptTypes):
-    
     with open(outCSV, "wb") as outF:
-        a = csv.writer(outF, delimiter=',')
-        a.writerow(["x-coordinate","y-coordinate","Similarity_score"])        
-
-        files_tuple = itertools.combinations(filterFiles(inputDir, acceptTypes), 2)
-        for file1, file2 in files_tuple:
-            try:
-                row_cosine_distance = [file1, file2]
-            
-                file1_parsedData = parser.from_file(file1)
-                file2_parsedData = parser.from_file(file2)
-           
-                v1 = Vector(file1, file1_parsedData["metadata"])
-                v2 = Vector(file2, file2_parsedData["metadata"])
-            
-
-                row_cosine_distance.append(v1.cosTheta(v2))            
-
-                a.writerow(row_cosine_distance)  
-            except ConnectionError:
-                sleep(1)
-            except KeyError:
-                continue
+        writeUpperTriangle(CosineMatrix(corpus.vectors), corpus.filenames, outF,
+                           blockRows(len(corpus), blockSize, memoryBudget, workers), topK, minScore, workers, outFormat)
 
 
 if __name__ == "__main__":
@@ -76,7 +53,40 @@ if __name__ == "__main__":
     argParser.add_argument('--inputDir', required=True, help='path to directory containing files')
     argParser.add_argument('--outCSV', required=True, help='path to directory for storing the output CSV File, containing pair-wise Cosine similarity Scores')
     argParser.add_argument('--accept', nargs='+', type=str, help='Optional: compute similarity only on specified IANA MIME Type(s)')
+    argParser.add_argument('--cache', default=DEFAULT_CACHE, help='Optional: path to the Tika metadata cache (default: %(default)s)')
+    argParser.add_argument('--tikaServer', help='Optional: URL of the Tika server (default: local tika-python server)')
+    argParser.add_argument('--tikaWorkers', type=int, default=4, help='Optional: number of concurrent Tika requests (default: %(default)s)')
+    argParser.add_argument('--tikaTimeout', type=float, default=300, help='Optional: seconds to wait for Tika to answer a request before retrying (default: %(default)s)')
+    argParser.add_argument('--blockSize', type=int, help='Optional: number of documents scored against the rest of the corpus at a time')
+    argParser.add_argument('--memoryBudget', type=float, help='Optional: cap on the memory used for scores, in MB (ignored when --blockSize is given)')
+    argParser.add_argument('--topK', type=int, help='Optional: only write the TOPK most similar neighbours of each document')
+    argParser.add_argument('--minScore', type=float, help='Optional: only write pairs scoring at least MINSCORE')
+    argParser.add_argument('--workers', type=int, default=1, help='Optional: number of processes scoring pairs (default: %(default)s)')
+    argParser.add_argument('--incremental', action='store_true', help='Optional: only score pairs of files added or changed since the last --incremental run, and patch OUTCSV')
+    argParser.add_argument('--checkIncremental', action='store_true', help='Optional: after an --incremental update, rescore all pairs and fail if OUTCSV differs')
+    argParser.add_argument('--outFormat', choices=['csv', 'binary'], default='csv', help='Optional: write OUTCSV as CSV rows or as a compact binary score store (default: %(default)s)')
     args = argParser.parse_args()
 
+    if args.tikaWorkers < 1:
+        argParser.error('--tikaWorkers must be at least 1')
+    if args.tikaTimeout <= 0:
+        argParser.error('--tikaTimeout must be positive')
+    if args.topK is not None and args.topK < 1:
+        argParser.error('--topK must be at least 1')
+    if args.incremental and args.topK:
+        argParser.error('--incremental cannot be combined with --topK')
+    if args.incremental and args.outFormat != 'csv':
+        argParser.error('--incremental only patches CSV output')
+    if args.checkIncremental and not args.incremental:
+        argParser.error('--checkIncremental requires --incremental')
+
     if args.inputDir and args.outCSV:
-        computeScores(args.inputDir, args.outCSV, args.accept)
\ No newline at end of file
+        cache = MetadataCache(args.cache)
+        try:
+            differing = computeScores(args.inputDir, args.outCSV, args.accept, cache, TikaClient(args.tikaServer, args.tikaWorkers, readTimeout=args.tikaTimeout),
+                                      args.blockSize, args.memoryBudget, args.topK, args.minScore, args.workers, args.incremental,
+                                      args.outFormat, args.checkIncremental)
+        finally:
+            cache.close()
+        if differing:
+            argParser.exit(1, str(differing) + " pairs of " + args.outCSV + " differ from a full rescore\n")
\ No newline at end of file
@@ -0,0 +1,114 @@
+#!/usr/bin/env python2.7
+#
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+
+# Point-to-point distance store for the k-means/k-medoids clusterers
+
+import numpy as np
+from multiprocessing import Pool
+
+class CondensedDistanceMatrix:
+    '''
+    Symmetric distances between n points in a condensed upper-triangular
+    float32 array of n(n-1)/2 entries, optionally memory-mapped on disk.
+
+    Every point is given an integer .index; entries start as NaN and are
+    filled lazily on first lookup, or all at once by precompute().
+    '''
+
+    def __init__(self, points, distance, memmapPath=None):
+        '''
+        @param distance callable(point1, point2) -> float
+        @param memmapPath file backing the array, for n too large for RAM
+        '''
+        self.points = points
+        self.distance = distance
+        self.n = len(points)
+
+        size = max(self.n * (self.n - 1) // 2, 1)
+        if memmapPath:
+            self.distances = np.memmap(memmapPath, dtype=np.float32, mode='w+', shape=(size,))
+        else:
+            self.distances = np.empty(size, dtype=np.float32)
+        self.distances.fill(np.nan)
+        self.item = self.distances.item
+
+        for index, point in enumerate(points):
+            point.index = index
+
+
+    def rowOffset(self, i):
+        '''
+        Position of entry (i, i + 1) in the condensed array
+        '''
+        return self.n * i - i * (i + 1) // 2
+
+
+    def get(self, i, j):
+        if i == j:
+            return 0.0
+        if i > j:
+            i, j = j, i
+
+        k = (i * (self.n + self.n - i - 1) >> 1) + j - i - 1        # rowOffset(i) + j - i - 1, inlined
+        distance = self.item(k)
+        if distance != distance:        # NaN: not computed yet
+            self.distances[k] = self.distance(self.points[i], self.points[j])
+            distance = self.item(k)
+        return distance
+
+
+    def row(self, i):
+        '''
+        float64 array of the distances from point i to every point
+        '''
+        return np.array([self.get(i, j) for j in range(self.n)])
+
+
+    def precompute(self, workers=1):
+        '''
+        Fill every entry, row by row, in a forked process pool
+        '''
+        global _sharedMatrix
+        rows = range(self.n - 1)
+
+        if workers <= 1:
+            for i in rows:
+                start = self.rowOffset(i)
+                self.distances[start:start + self.n - i - 1] = _distanceRow(self, i)
+            return
+
+        _sharedMatrix = self
+        pool = Pool(workers)
+        try:
+            for i, distances in pool.imap_unordered(_precomputeRow, rows, chunksize=16):
+                start = self.rowOffset(i)
+                self.distances[start:start + self.n - i - 1] = distances
+        finally:
+            pool.terminate()
+            _sharedMatrix = None
+
+
+_sharedMatrix = None
+
+def _distanceRow(matrix, i):
+    point = matrix.points[i]
+    return np.array([matrix.distance(point, matrix.points[j]) for j in range(i + 1, matrix.n)], dtype=np.float32)
+
+def _precomputeRow(i):
+    return i, _distanceRow(_sharedMatrix, i)
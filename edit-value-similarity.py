@@ -17,10 +17,16 @@
 #
 #
 
-from tika import parser
-import os, editdistance, itertools, argparse, csv
-from requests import ConnectionError
-from time import sleep
+from metadata_cache import MetadataCache, DEFAULT_CACHE
+from corpus import Corpus
+from edit_distance import valueDistances, lengthBound
+from score_manifest import updateScores, checkScores
+from pairwise import PairFunctionScorer, writeUpperTriangle, blockRows
+from tika_client import TikaClient
+from functools import partial
+import argparse
+
+na_metadata = ["resourceName"]
 
 def stringify(attribute_value):
     if isinstance(attribute_value, list):
@@ -29,78 +35,67 @@ def stringify(attribute_value):
         return str(attribute_value.encode('utf-8').strip())
 
 
-def computeScores(inputDir, outCSV, acceptTypes, allKeys):
-
-    na_metadata = ["resourceName"]
-    with open(outCSV, "wb") as outF:
-        a = csv.writer(outF, delimiter=',')
-        a.writerow(["x-coordinate","y-coordinate","Similarity_score"])
-
-        filename_list = []
-
-        for root, dirnames, files in os.walk(inputDir):
-            dirnames[:] = [d for d in dirnames if not d.startswith('.')]
-            for filename in files:
-                if not filename.startswith('.'):
-                    filename_list.append(os.path.join(root, filename))
-        try:
-            filename_list = [filename for filename in filename_list if "metadata" in parser.from_file(filename)]
-        except ConnectionError:
-            sleep(1)
+def stringifyFeatures(filename, metadata):
+    return dict((feature, stringify(value)) for feature, value in metadata.iteritems() if feature not in na_metadata)
 
-        
 
-        if acceptTypes:
-            filename_list = [filename for filename in filename_list if str(parser.from_file(filename)['metadata']['Content-Type'].encode('utf-8')).split('/')[-1] in acceptTypes]
-        else:
-            print "Accepting all MIME Types....."
+def editScore(file1_features, file2_features, allKeys=False, minScore=None):
+    '''
+    1 - average normalized edit distance of the values of shared keys
+    (each key present in only one file counts as distance 1 with allKeys).
 
-        files_tuple = itertools.combinations(filename_list, 2)
-        for file1, file2 in files_tuple:
-            try:           
-                row_edit_distance = [file1, file2]            
+    With minScore, pairs that provably score below it are abandoned early
+    and NaN is returned, which the pairwise writers drop.
+    '''
+    intersect_features = set(file1_features) & set(file2_features)
 
-                file1_parsedData = parser.from_file(file1)
-                file2_parsedData = parser.from_file(file2)
-                
-                intersect_features = set(file1_parsedData["metadata"].keys()) & set(file2_parsedData["metadata"].keys()) 
-                            
-                intersect_features = [feature for feature in intersect_features if feature not in na_metadata ]
+    if allKeys:
+        disjunct_features = len(file1_features) + len(file2_features) - 2 * len(intersect_features)
+        total_features = float(len(intersect_features) + disjunct_features)
+        file_edit_distance = float(disjunct_features)       # increment by 1 for each disjunct feature in (A-B) & (B-A), file1_disjunct_feature_value/file1_disjunct_feature_value = 1
+    else:
+        total_features = float(len(intersect_features))    #average edit distance
+        file_edit_distance = 0.0
 
-                file_edit_distance = 0.0
-                for feature in intersect_features:
+    if minScore is None:
+        for feature in intersect_features:
+            file_edit_distance += valueDistances.normalizedDistance(file1_features[feature], file2_features[feature])
+        return 1 - file_edit_distance / total_features
 
-                    file1_feature_value = stringify(file1_parsedData["metadata"][feature])
-                    file2_feature_value = stringify(file2_parsedData["metadata"][feature])
+    # the length difference bounds each edit distance from below, so the pair
+    # can be dropped as soon as the bounded total exceeds what minScore allows
+    max_edit_distance = (1 - minScore) * total_features
+    bounds = dict((feature, lengthBound(file1_features[feature], file2_features[feature])) for feature in intersect_features)
+    remaining_bound = sum(bounds.itervalues())
 
-                    if len(file1_feature_value) == 0 and len(file2_feature_value) == 0:
-                        feature_distance = 0.0
-                    else:
-                        feature_distance = float(editdistance.eval(file1_feature_value, file2_feature_value))/(len(file1_feature_value) if len(file1_feature_value) > len(file2_feature_value) else len(file2_feature_value))
-                    
-                    file_edit_distance += feature_distance
+    for feature in intersect_features:
+        if file_edit_distance + remaining_bound > max_edit_distance:
+            return float('nan')
+        remaining_bound -= bounds[feature]
+        file_edit_distance += valueDistances.normalizedDistance(file1_features[feature], file2_features[feature])
 
-            
-                if allKeys:
-                    file1_only_features = set(file1_parsedData["metadata"].keys()) - set(intersect_features)
-                    file1_only_features = [feature for feature in file1_only_features if feature not in na_metadata]
+    return 1 - file_edit_distance / total_features
 
-                    file2_only_features = set(file2_parsedData["metadata"].keys()) - set(intersect_features)
-                    file2_only_features = [feature for feature in file2_only_features if feature not in na_metadata]
 
-                    file_edit_distance += len(file1_only_features) + len(file2_only_features)       # increment by 1 for each disjunct feature in (A-B) & (B-A), file1_disjunct_feature_value/file1_disjunct_feature_value = 1
-                    file_edit_distance /= float(len(intersect_features) + len(file1_only_features) + len(file2_only_features))
+def computeScores(inputDir, outCSV, acceptTypes, allKeys, cache, client, blockSize=None, memoryBudget=None, topK=None, minScore=None, workers=1, incremental=False, outFormat="csv", check=False):
+    '''
+    @param check after an incremental update, rescore every pair and
+           return the number of pairs that differ from the updated CSV
+    '''
 
-                else:
-                    file_edit_distance /= float(len(intersect_features))    #average edit distance
+    corpus = Corpus(inputDir, acceptTypes, cache, stringifyFeatures, client)
 
-                row_edit_distance.append(1-file_edit_distance)
-                a.writerow(row_edit_distance)
+    if incremental:
+        options = {"measure": "edit", "inputDir": inputDir, "accept": acceptTypes, "allKeys": allKeys, "minScore": minScore}
+        scorerFactory = lambda vectors: PairFunctionScorer(vectors, partial(editScore, allKeys=allKeys, minScore=minScore))
+        updateScores(corpus, scorerFactory, outCSV, options, blockSize, memoryBudget, minScore, workers)
+        if check:
+            return checkScores(corpus, scorerFactory, outCSV, blockSize, memoryBudget, minScore, workers)
+        return
 
-            except ConnectionError:
-                sleep(1)
-            except KeyError:
-                continue
+    with open(outCSV, "wb") as outF:
+        writeUpperTriangle(PairFunctionScorer(corpus.vectors, partial(editScore, allKeys=allKeys, minScore=minScore)), corpus.filenames, outF,
+                           blockRows(len(corpus), blockSize, memoryBudget, workers), topK, minScore, workers, outFormat)
 
 
 if __name__ == "__main__":
@@ -110,7 +105,40 @@ if __name__ == "__main__":
     argParser.add_argument('--outCSV', required=True, help='path to directory for storing the output CSV File, containing pair-wise Similarity Scores based on edit distance')
     argParser.add_argument('--accept', nargs='+', type=str, help='Optional: compute similarity only on specified IANA MIME Type(s)')
     argParser.add_argument('--allKeys', action='store_true', help='compute edit distance across all keys')
+    argParser.add_argument('--cache', default=DEFAULT_CACHE, help='Optional: path to the Tika metadata cache (default: %(default)s)')
+    argParser.add_argument('--tikaServer', help='Optional: URL of the Tika server (default: local tika-python server)')
+    argParser.add_argument('--tikaWorkers', type=int, default=4, help='Optional: number of concurrent Tika requests (default: %(default)s)')
+    argParser.add_argument('--tikaTimeout', type=float, default=300, help='Optional: seconds to wait for Tika to answer a request before retrying (default: %(default)s)')
+    argParser.add_argument('--blockSize', type=int, help='Optional: number of documents scored against the rest of the corpus at a time')
+    argParser.add_argument('--memoryBudget', type=float, help='Optional: cap on the memory used for scores, in MB (ignored when --blockSize is given)')
+    argParser.add_argument('--topK', type=int, help='Optional: only write the TOPK most similar neighbours of each document')
+    argParser.add_argument('--minScore', type=float, help='Optional: only write pairs scoring at least MINSCORE')
+    argParser.add_argument('--workers', type=int, default=1, help='Optional: number of processes scoring pairs (default: %(default)s)')
+    argParser.add_argument('--incremental', action='store_true', help='Optional: only score pairs of files added or changed since the last --incremental run, and patch OUTCSV')
+    argParser.add_argument('--checkIncremental', action='store_true', help='Optional: after an --incremental update, rescore all pairs and fail if OUTCSV differs')
+    argParser.add_argument('--outFormat', choices=['csv', 'binary'], default='csv', help='Optional: write OUTCSV as CSV rows or as a compact binary score store (default: %(default)s)')
     args = argParser.parse_args()
 
+    if args.tikaWorkers < 1:
+        argParser.error('--tikaWorkers must be at least 1')
+    if args.tikaTimeout <= 0:
+        argParser.error('--tikaTimeout must be positive')
+    if args.topK is not None and args.topK < 1:
+        argParser.error('--topK must be at least 1')
+    if args.incremental and args.topK:
+        argParser.error('--incremental cannot be combined with --topK')
+    if args.incremental and args.outFormat != 'csv':
+        argParser.error('--incremental only patches CSV output')
+    if args.checkIncremental and not args.incremental:
+        argParser.error('--checkIncremental requires --incremental')
+
     if args.inputDir and args.outCSV:
-        computeScores(args.inputDir, args.outCSV, args.accept, args.allKeys)
\ No newline at end of file
+        cache = MetadataCache(args.cache)
+        try:
+            differing = computeScores(args.inputDir, args.outCSV, args.accept, args.allKeys, cache, TikaClient(args.tikaServer, args.tikaWorkers, readTimeout=args.tikaTimeout),
+                                      args.blockSize, args.memoryBudget, args.topK, args.minScore, args.workers, args.incremental,
+                                      args.outFormat, args.checkIncremental)
+        finally:
+            cache.close()
+        if differing:
+            argParser.exit(1, str(differing) + " pairs of " + args.outCSV + " differ from a full rescore\n")
\ No newline at end of file
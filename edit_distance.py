@@ -0,0 +1,59 @@
+#!/usr/bin/env python2.7
+#
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+
+# Memoized, length-normalized edit distance between metadata values
+
+import editdistance
+
+def lengthBound(value1, value2):
+    '''
+    Cheap lower bound of normalizedDistance: at least |len1 - len2| edits
+    are needed, out of max(len1, len2)
+    '''
+    longest = max(len(value1), len(value2))
+    if longest == 0:
+        return 0.0
+    return float(abs(len(value1) - len(value2))) / longest
+
+
+class EditDistanceCache:
+    '''
+    editdistance.eval(value1, value2) / max(len1, len2), memoized on the
+    value pair. Metadata values such as Content-Type or camera models repeat
+    across thousands of files, so most pairs are seen many times.
+    '''
+
+    def __init__(self, maxEntries=1000000):
+        self.maxEntries = maxEntries
+        self.distances = {}
+
+    def normalizedDistance(self, value1, value2):
+        if value1 == value2:
+            return 0.0
+        key = (value1, value2) if value1 < value2 else (value2, value1)
+        distance = self.distances.get(key)
+        if distance is None:
+            distance = float(editdistance.eval(value1, value2)) / max(len(value1), len(value2))
+            if len(self.distances) >= self.maxEntries:
+                self.distances.clear()
+            self.distances[key] = distance
+        return distance
+
+
+valueDistances = EditDistanceCache()
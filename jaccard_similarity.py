@@ -19,47 +19,73 @@
 
 # Computing pairwise jaccard similarity for a given directory of files
 
-from tika import parser
-import os, itertools, argparse, csv
-
-def filterFiles(inputDir, acceptTypes):
-    filename_list = []
-
-    for root, dirnames, files in os.walk(inputDir):
-        dirnames[:] = [d for d in dirnames if not d.startswith('.')]
-        for filename in files:
-            if not filename.startswith('.'):
-                filename_list.append(os.path.join(root, filename))
-
-    filename_list = [filename for filename in filename_list if parser.from_file(filename)]
-    if acceptTypes:
-        filename_list = [filename for filename in filename_list if str(parser.from_file(filename)['metadata']['Content-Type'].encode('utf-8')).split('/')[-1] in acceptTypes]
+from metadata_cache import MetadataCache, DEFAULT_CACHE
+from corpus import Corpus
+from pairwise import PairFunctionScorer, TopKNeighbours, writeUpperTriangle, blockRows, pairWriter
+from minhash import MinHash, LSHIndex, metadataTokens
+from tika_client import TikaClient
+import argparse
+
+
+def jaccardScore(f1MetaData, f2MetaData):
+
+    isCoExistant = lambda k: ( k in f2MetaData) and ( f1MetaData[k] == f2MetaData[k] )
+    intersection = reduce(lambda m,k: (m + 1) if isCoExistant(k) else m, f1MetaData.keys(), 0)
+
+
+    union = len(f1MetaData.keys()) + len(f2MetaData.keys()) - intersection
+    return float(intersection) / union
+
+
+def writeLSHScores(corpus, outF, threshold, numPerm=128, topK=None, outFormat="csv"):
+    '''
+    Score only the MinHash/LSH candidate pairs likely to reach threshold,
+    re-scored exactly with jaccardScore. Pairs are written as they are
+    found, not in itertools.combinations order, and a pair reaching
+    threshold is only found with high probability.
+    '''
+    minHash = MinHash(numPerm)
+    index = LSHIndex(threshold, numPerm)
+    for i, metadata in enumerate(corpus.metadata):
+        index.add(i, minHash.signature(metadataTokens(metadata)))
+
+    print "Scoring LSH candidate pairs ( bands =", index.bands, ", rows =", index.rows, ")"
+
+    pairs = pairWriter(outF, corpus.filenames, outFormat)
+    counts = [0, 0]
+
+    def scored():
+        for i, j in index.candidatePairs():
+            counts[0] += 1
+            jaccard = jaccardScore(corpus.metadata[i], corpus.metadata[j])
+            if jaccard >= threshold:
+                counts[1] += 1
+                yield i, j, jaccard
+
+    if topK:
+        topNeighbours = TopKNeighbours(len(corpus), topK)
+        for i, j, jaccard in scored():
+            topNeighbours.push(i, [jaccard], [j])
+            topNeighbours.push(j, [jaccard], [i])
+        pairs.writeTriples(topNeighbours.neighbours())
     else:
-        print "Accepting all MIME Types....."
+        pairs.writeTriples(scored())
 
-    return filename_list
+    pairs.close()
+    print "Scored", counts[0], "candidate pairs,", counts[1], "reached", threshold
 
 
-def computeScores(inputDir, outCSV, acceptTypes):
-
-    with open(outCSV, "wb") as outF:
-      a = csv.writer(outF, delimiter=',')
-      a.writerow(["x-coordinate","y-coordinate","Similarity_score"])
-
-      files_tuple = itertools.combinations(filterFiles(inputDir, acceptTypes), 2)
+def computeScores(inputDir, outCSV, acceptTypes, cache, client, blockSize=None, memoryBudget=None, topK=None, minScore=None, workers=1,
+                  lsh=False, numPerm=128, outFormat="csv"):
 
-      for file1, file2 in files_tuple:
-        f1MetaData = parser.from_file(file1)["metadata"]
-        f2MetaData = parser.from_file(file2)["metadata"]
+    corpus = Corpus(inputDir, acceptTypes, cache, None, client)
 
-        isCoExistant = lambda k: ( k in f2MetaData) and ( f1MetaData[k] == f2MetaData[k] )
-        intersection = reduce(lambda m,k: (m + 1) if isCoExistant(k) else m, f1MetaData.keys(), 0)
-
-
-        union = len(f1MetaData.keys()) + len(f2MetaData.keys()) - intersection
-        jaccard = float(intersection) / union
-
-        a.writerow([file1, file2, jaccard])
+    with open(outCSV, "wb") as outF:
+      if lsh:
+          writeLSHScores(corpus, outF, minScore, numPerm, topK, outFormat)
+      else:
+          writeUpperTriangle(PairFunctionScorer(corpus.metadata, jaccardScore), corpus.filenames, outF,
+                             blockRows(len(corpus), blockSize, memoryBudget, workers), topK, minScore, workers, outFormat)
 
 
 if __name__ == "__main__":
@@ -68,7 +94,34 @@ if __name__ == "__main__":
     argParser.add_argument('--inputDir', required=True, help='path to directory containing files')
     argParser.add_argument('--outCSV', required=True, help='path to directory for storing the output CSV File, containing pair-wise Jaccard similarity Scores')
     argParser.add_argument('--accept', nargs='+', type=str, help='Optional: compute similarity only on specified IANA MIME Type(s)')
+    argParser.add_argument('--cache', default=DEFAULT_CACHE, help='Optional: path to the Tika metadata cache (default: %(default)s)')
+    argParser.add_argument('--tikaServer', help='Optional: URL of the Tika server (default: local tika-python server)')
+    argParser.add_argument('--tikaWorkers', type=int, default=4, help='Optional: number of concurrent Tika requests (default: %(default)s)')
+    argParser.add_argument('--tikaTimeout', type=float, default=300, help='Optional: seconds to wait for Tika to answer a request before retrying (default: %(default)s)')
+    argParser.add_argument('--blockSize', type=int, help='Optional: number of documents scored against the rest of the corpus at a time')
+    argParser.add_argument('--memoryBudget', type=float, help='Optional: cap on the memory used for scores, in MB (ignored when --blockSize is given)')
+    argParser.add_argument('--topK', type=int, help='Optional: only write the TOPK most similar neighbours of each document')
+    argParser.add_argument('--minScore', type=float, help='Optional: only write pairs scoring at least MINSCORE')
+    argParser.add_argument('--workers', type=int, default=1, help='Optional: number of processes scoring pairs (default: %(default)s)')
+    argParser.add_argument('--lsh', action='store_true', help='Optional: only score MinHash/LSH candidate pairs likely to reach --minScore')
+    argParser.add_argument('--numPerm', type=int, default=128, help='Optional: number of MinHash permutations (default: %(default)s)')
+    argParser.add_argument('--outFormat', choices=['csv', 'binary'], default='csv', help='Optional: write OUTCSV as CSV rows or as a compact binary score store (default: %(default)s)')
     args = argParser.parse_args()
 
+    if args.tikaWorkers < 1:
+        argParser.error('--tikaWorkers must be at least 1')
+    if args.tikaTimeout <= 0:
+        argParser.error('--tikaTimeout must be positive')
+    if args.topK is not None and args.topK < 1:
+        argParser.error('--topK must be at least 1')
+    if args.lsh and args.minScore is None:
+        argParser.error('--lsh requires --minScore')
+
     if args.inputDir and args.outCSV:
-        computeScores(args.inputDir, args.outCSV, args.accept)
+        cache = MetadataCache(args.cache)
+        try:
+            computeScores(args.inputDir, args.outCSV, args.accept, cache, TikaClient(args.tikaServer, args.tikaWorkers, readTimeout=args.tikaTimeout),
+                          args.blockSize, args.memoryBudget, args.topK, args.minScore, args.workers,
+                          args.lsh, args.numPerm, args.outFormat)
+        finally:
+            cache.close()
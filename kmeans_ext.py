@@ -17,31 +17,19 @@
 #
 #
 
-from tika import parser
+from metadata_cache import MetadataCache, DEFAULT_CACHE
+from corpus import Corpus
+from tika_client import TikaClient
 from vector_ext import Vector
-from random import randint, sample
+from vector_compact import CompactVector
+from distance_matrix import CondensedDistanceMatrix
+from random import Random, randint, random, sample, seed as randomSeed
+from multiprocessing import Pool
+from collections import deque
 import argparse, os, csv, itertools, copy, json, sys
 
 union_features = set()
 
-def filterFiles(inputDir, acceptTypes):
-    filename_list = []
-
-    for root, dirnames, files in os.walk(inputDir):
-        dirnames[:] = [d for d in dirnames if not d.startswith('.')]
-        for filename in files:
-            if not filename.startswith('.'):
-                filename_list.append(os.path.join(root, filename))
-
-    filename_list = [filename for filename in filename_list if parser.from_file(filename)]
-    if acceptTypes:
-        filename_list = [filename for filename in filename_list if str(parser.from_file(filename)['metadata']['Content-Type'].encode('utf-8')).split('/')[-1] in acceptTypes]
-    else:
-        print "Accepting all MIME Types....."
-
-    return filename_list
-
-
 def compute_Mean(list_of_points):
     
 #     if distanceCalc == calcEuclidian:
@@ -58,6 +46,8 @@ def compute_Mean(list_of_points):
 # 
 #     else:
 #         new_centroid = chooseClustroid(list_of_points)
+    if medoidEngine is not None:
+        return medoidEngine.medoid(list_of_points)
     new_centroid = chooseClustroid(list_of_points)
     return new_centroid	
 	
@@ -79,6 +69,134 @@ def chooseClustroid(points):
     
     return clustroid
 
+class IncrementalMedoids:
+    '''
+    Clustroid selection from per-point distance sums that are carried over
+    between iterations.
+
+    Each point remembers the members of the cluster its sum was computed
+    against. When the cluster changes, only the distances to the points that
+    left or joined are subtracted or added, so once assignments settle a
+    medoid update costs O(moved points x cluster size) instead of O(m^2).
+    '''
+
+    def __init__(self):
+        self.sums = {}
+        self.clusterOf = {}
+
+
+    def medoid(self, points):
+        '''
+        Point of points with the lowest total distance to the others
+        '''
+        members = frozenset(points)
+
+        # points coming from the same old cluster share the same difference
+        groups = {}
+        for point in points:
+            groups.setdefault(self.clusterOf.get(point), []).append(point)
+
+        for old, group in groups.iteritems():
+            if old is not None:
+                left = old - members
+                joined = members - old
+            if old is None or len(left) + len(joined) >= len(members):
+                for p in group:
+                    self.sums[p] = sum(calculateDistance(p, q) for q in points)
+            else:
+                for p in group:
+                    self.sums[p] += (sum(calculateDistance(p, q) for q in joined)
+                                     - sum(calculateDistance(p, q) for q in left))
+
+            for p in group:
+                self.clusterOf[p] = members
+
+        return min(points, key=self.sums.__getitem__)
+
+
+class HamerlyBounds:
+    '''
+    Cluster assignment that skips distance evaluations by the triangle
+    inequality (Hamerly, "Making k-means even faster", 2010), so it is only
+    valid for metric measures.
+
+    Every point keeps an upper bound on the distance to its own centroid and
+    a lower bound on the distance to any other one. When the centroids move,
+    the bounds are loosened by how far they moved, and a point is only
+    compared with every centroid once its bounds overlap.
+    '''
+
+    def __init__(self, list_of_points, centroids):
+        self.points = list_of_points
+        self.centroids = centroids
+        self.assigned = []
+        self.upper = []
+        self.lower = []
+        for point in list_of_points:
+            closest, upper, lower = self.nearest(point)
+            self.assigned.append(closest)
+            self.upper.append(upper)
+            self.lower.append(lower)
+
+
+    def nearest(self, point):
+        '''
+        (index of the closest centroid, distance to it, distance to the
+        second closest), ties going to the lowest index as in cluster_assignment
+        '''
+        distances = [calculateDistance(point, centroid) for centroid in self.centroids]
+        closest = distances.index(min(distances))
+        others = distances[:closest] + distances[closest + 1:]
+        return closest, distances[closest], min(others) if others else float('inf')
+
+
+    def clusters(self):
+        clusters = {}
+        for point, closest in zip(self.points, self.assigned):
+            clusters.setdefault(closest, []).append(point)
+        return clusters
+
+
+    def update(self, centroids, previous):
+        '''
+        Reassign every point after the centroids moved
+        @param previous previous[j] is the index of the old centroid that
+               centroids[j] replaces (see move_centroid)
+        @return clusters, as cluster_assignment(list_of_points, centroids)
+        '''
+        moved = [calculateDistance(self.centroids[old], new) for old, new in zip(previous, centroids)]
+        renumber = dict((old, j) for j, old in enumerate(previous))
+        self.centroids = centroids
+
+        # no point within half the gap to the closest other centroid can switch
+        half = []
+        for j, centroid in enumerate(centroids):
+            gaps = [calculateDistance(centroid, other) for l, other in enumerate(centroids) if l != j]
+            half.append(min(gaps) / 2.0 if gaps else float('inf'))
+
+        furthest = moved.index(max(moved))
+        others = moved[:furthest] + moved[furthest + 1:]
+        maxMoved = (max(others) if others else 0.0, moved[furthest])
+
+        for i, point in enumerate(self.points):
+            closest = renumber[self.assigned[i]]
+            upper = self.upper[i] + moved[closest]
+            lower = self.lower[i] - maxMoved[closest != furthest]
+
+            # strict comparisons keep ties resolved exactly as a full scan
+            bound = max(lower, half[closest])
+            if upper >= bound:
+                upper = calculateDistance(point, centroids[closest])
+                if upper >= bound:
+                    closest, upper, lower = self.nearest(point)
+
+            self.assigned[i] = closest
+            self.upper[i] = upper
+            self.lower[i] = lower
+
+        return self.clusters()
+
+
 def cluster_assignment(list_of_points, centroids):
     '''
     Assign points to nearest centroid 
@@ -115,18 +233,10 @@ def move_centroid(clusters):
 
 	
 def calculateDistance(v1, v2):    
-    if not hasattr(v2, 'filename'):
+    if distanceMatrix is None or getattr(v2, 'index', None) is None:
         return distanceCalc(v1, v2)
     else:
-        global distanceCache
-        if (v1.filename, v2.filename) in distanceCache:
-            return distanceCache[v1.filename, v2.filename]
-        elif (v2.filename, v1.filename) in distanceCache:
-            return distanceCache[v2.filename, v1.filename]
-        else:
-            distance = distanceCalc(v1, v2)
-            distanceCache[v1.filename, v2.filename] = distance
-            return distance
+        return distanceMatrix.get(v1.index, v2.index)
 
 def calcEuclidian(v1, v2):
     return v1.euclidean_dist(v2)
@@ -140,10 +250,64 @@ def calcEdit(v1, v2):
 def calcJaccard(v1, v2):
     return v1.jaccard_dist(v2)
 	
-def K_Means(list_of_points, no_centroids):
+def partition(clusters):
+    '''
+    Cluster memberships, independent of the cluster keys
+    '''
+    return set(frozenset(id(point) for point in points) for points in clusters.itervalues())
+
+def compute_distortion(list_of_points, clusters, centroids):
+    distortion_sum = 0.0
+    for key in clusters:
+        for point in clusters[key]:
+            distortion_sum += calculateDistance(point, centroids[key])
+    return distortion_sum / float(len(list_of_points))
+
+def kmeans_plus_plus(list_of_points, no_centroids):
+    '''
+    k-means++ seeding under the current distance measure: after a uniform
+    first pick, each centroid is drawn with probability proportional to the
+    squared distance of a point to its nearest centroid so far
+    @return indices of the chosen points
+    '''
+    chosen = [randint(0, len(list_of_points) - 1)]
+    nearest = [calculateDistance(point, list_of_points[chosen[0]]) ** 2 for point in list_of_points]
+
+    while len(chosen) < no_centroids:
+        total = sum(nearest)
+        if total > 0:
+            threshold = random() * total
+            for i, weight in enumerate(nearest):
+                if weight > 0:
+                    pick = i
+                    threshold -= weight
+                    if threshold < 0:
+                        break
+        else:       # every point coincides with a centroid already
+            pick = sample([i for i in range(len(list_of_points)) if i not in chosen], 1)[0]
+
+        chosen.append(pick)
+        centroid = list_of_points[pick]
+        nearest = [min(d, calculateDistance(point, centroid) ** 2) for d, point in zip(nearest, list_of_points)]
+
+    return chosen
+
+def K_Means(list_of_points, no_centroids, maxIterations=300, tolerance=0.0, init="random"):
+    '''
+    One k-medoids run
+    @param maxIterations upper bound on reassignment iterations
+    @param tolerance also stop once an iteration improves the distortion by
+           less than this (default: only stop when assignments stop changing)
+    @param init "random" picks the initial centroids uniformly, "kmeans++"
+           spreads them out with k-means++ seeding
+    @return [distortion, clusters, iterations used]
+    '''
     centroids = []
     
-    randCentroid = sample(range(0, len(list_of_points)), no_centroids)
+    if init == "kmeans++":
+        randCentroid = kmeans_plus_plus(list_of_points, no_centroids)
+    else:
+        randCentroid = sample(range(0, len(list_of_points)), no_centroids)
     for i in randCentroid:
         centroids.append(list_of_points[i])
 #         print list_of_points[i].features
@@ -160,38 +324,142 @@ def K_Means(list_of_points, no_centroids):
     
     
         
-    clusters = cluster_assignment(list_of_points, centroids)
+    if metricDistance:
+        bounds = HamerlyBounds(list_of_points, centroids)
+        clusters = bounds.clusters()
+    else:
+        bounds = None
+        clusters = cluster_assignment(list_of_points, centroids)
 
     # generates different clusters each time
     # leverage the same "Dongni" compute-clusters.py
-    for i in range(0, 300):             # perform iterations till convergence global minima    # default 300
+    distortion = None
+    for iterations in range(1, max(maxIterations, 1) + 1):
 
-        new_centroids =  move_centroid(clusters)     #'''centroids vs new_centroids, use centroids again???'''
-        clusters = cluster_assignment(list_of_points, new_centroids)   #''' #old_clusters = first_clusters '''
+        new_centroids =  move_centroid(clusters)
+        if bounds:
+            new_clusters = bounds.update(new_centroids, list(clusters))
+        else:
+            new_clusters = cluster_assignment(list_of_points, new_centroids)
 
-    ''' pseudocode 
-    # clusters =>   converged / recent values of clusters???
-    # new_centroids => recent value of c
-    '''
-    #print clusters
-    # compute & return distortion (new_centroids, clusters)
+        # unchanged assignments give unchanged clustroids: a fixed point
+        converged = partition(new_clusters) == partition(clusters)
+        clusters = new_clusters
+        if converged:
+            break
 
-    distortion_sum = 0.0
-    for key in clusters:
-        for point in clusters[key]:
-            distortion_sum += calculateDistance(point, new_centroids[key])
-    distortion = distortion_sum / float(len(list_of_points))
+        if tolerance > 0:
+            new_distortion = compute_distortion(list_of_points, clusters, new_centroids)
+            if distortion is not None and distortion - new_distortion < tolerance:
+                break
+            distortion = new_distortion
 
-    return [distortion, clusters]
+    distortion = compute_distortion(list_of_points, clusters, new_centroids)
+
+    return [distortion, clusters, iterations]
     
-distanceCache = {}
+distanceMatrix = None
 distanceCalc = calcEuclidian
+medoidEngine = None
+metricDistance = False
+_restartPoints = None
+
+def _restart(task):
+    '''
+    One seeded K_Means run over _restartPoints, inherited by forked workers.
+    Clusters are returned as point indices, which are cheap to send back.
+    '''
+    k, seed, maxIterations, tolerance, init = task
+    randomSeed(seed)
+    distortion, clusters, iterations = K_Means(_restartPoints, k, maxIterations, tolerance, init)
+    return k, distortion, dict((key, [point.index for point in points]) for key, points in clusters.iteritems()), iterations
 
-def K_Means_iter(list_of_points, measure, inputK=None):
-    global distanceCache
+def run_restarts(list_of_points, kRange, restarts, maxIterations, tolerance, seed=None, workers=1,
+                 init="random", patience=None):
+    '''
+    Best of up to restarts K_Means runs for every k of kRange
+    @param seed derives one seed per run, so results do not depend on workers
+    @param workers number of processes sharing the distance matrix
+    @param patience stop the restarts of a k once its best distortion has not
+           improved over this many runs
+    @return {k: [distortion, clusters, iterations]}
+    '''
+    if restarts < 1:
+        raise ValueError("restarts must be at least 1, got " + str(restarts))
+
+    global _restartPoints
+    seeds = Random(seed)
+    tasks = iter([(k, seeds.randint(0, 2**31 - 1), maxIterations, tolerance, init)
+                  for k in kRange for i in range(restarts)])
+
+    _restartPoints = list_of_points
+    pool = Pool(workers) if workers > 1 else None
+    try:
+        global_minimas = {}
+        runs = {}
+        stale = {}
+        done = set()
+        queue = deque()
+        while True:
+            # keep the pool busy without queueing runs of a k that is done
+            while len(queue) < (2 * workers if pool else 1):
+                task = next((task for task in tasks if task[0] not in done), None)
+                if task is None:
+                    break
+                queue.append(pool.apply_async(_restart, (task,)) if pool else task)
+            if not queue:
+                break
+
+            item = queue.popleft()
+            k, distortion, clusters, iterations = item.get() if pool else _restart(item)
+            if k in done:
+                continue
+            print "k= " , k , " iteration ", runs.get(k, 0), " converged after", iterations, "iterations"
+            runs[k] = runs.get(k, 0) + 1
+
+            # results are handled in task order, so ties go to the earliest run
+            if k not in global_minimas or distortion < global_minimas[k][0]:
+                clusters = dict((key, [list_of_points[i] for i in indices]) for key, indices in clusters.iteritems())
+                global_minimas[k] = [distortion, clusters, iterations]
+                stale[k] = 0
+            else:
+                stale[k] += 1
+
+            if patience and stale[k] >= patience:
+                print "k= ", k, " no improvement over the last", patience, "runs, stopping after", runs[k], "runs"
+                done.add(k)
+    finally:
+        if pool:
+            pool.terminate()
+        _restartPoints = None
+
+    return global_minimas
+
+def K_Means_iter(list_of_points, measure, inputK=None, distanceFile=None, precompute=False, workers=1,
+                 maxIterations=300, tolerance=0.0, medoids="exhaustive", seed=None,
+                 init="random", restarts=51, patience=None, bounds=True):
+    '''
+    @param maxIterations, tolerance convergence criteria of each run, see K_Means
+    @param medoids "exhaustive" sums all pairwise distances of a cluster on
+           every update, "incremental" reuses each point's previous sum
+    @param distanceFile memory-map the point-to-point distances to this file
+    @param precompute fill all distances up front with workers processes,
+           instead of lazily
+    @param workers number of processes computing distances and running the
+           restarts; with more than one the distances are always precomputed,
+           so the forked workers share one filled matrix
+    @param seed seed of the restarts, for reproducible clusters
+    @param init, restarts, patience initial centroids, number of runs per k
+           and early stop of the runs, see K_Means and run_restarts
+    @param bounds skip distance evaluations with HamerlyBounds when the
+           measure is a metric (Euclidean, Jaccard)
+    '''
+    global distanceMatrix
     global distanceCalc
+    global medoidEngine
+    global metricDistance
     
-    distanceCache = {}
+    medoidEngine = IncrementalMedoids() if medoids == "incremental" else None
     distanceCalc = calcEuclidian
     distanceCalcName = "Euclidean Distance"
     
@@ -207,23 +475,19 @@ def K_Means_iter(list_of_points, measure, inputK=None):
             distanceCalcName = "Jaccard Distance"
     
     print "Clustering using " + distanceCalcName
-    
-    global_minimas = []
+
+    # Euclidean and Jaccard distances obey the triangle inequality
+    metricDistance = distanceCalc in (calcEuclidian, calcJaccard) and bounds
+
+    distanceMatrix = CondensedDistanceMatrix(list_of_points, distanceCalc, distanceFile)
+    if precompute or workers > 1:
+        distanceMatrix.precompute(workers)
     
     if inputK is None:
         kRange = range(2, 6)
-        for k in kRange:
-            global_minima = K_Means(list_of_points, k)
-    
-            for i in range(0, 50):
-                iteration = K_Means(list_of_points, k)
-                print "k= " , k , " iteration ", i
-                    
-                if iteration[0] < global_minima[0]:
-                    global_minima = iteration
-    
-            global_minimas.append(global_minima)
-    
+        minimas = run_restarts(list_of_points, kRange, restarts, maxIterations, tolerance, seed, workers,
+                               init, patience)
+        global_minimas = [minimas[k] for k in kRange]
             
         distortion_diffs = []
         for i in range(0, (len(global_minimas)-1) ):
@@ -240,16 +504,8 @@ def K_Means_iter(list_of_points, measure, inputK=None):
         return true_global_minima
     
     else:
-        global_minima = K_Means(list_of_points, inputK)
-    
-        for i in range(0, 50):
-            iteration = K_Means(list_of_points, k)
-            print "k= " , k , " iteration ", i
-                    
-            if iteration[0] < global_minima[0]:
-                global_minima = iteration
-    
-        return global_minima
+        return run_restarts(list_of_points, [inputK], restarts, maxIterations, tolerance, seed, workers,
+                            init, patience)[inputK]
     
 if __name__ == "__main__":
 
@@ -257,25 +513,50 @@ if __name__ == "__main__":
     argParser.add_argument('--inputDir', required=True, help='path to directory containing files')
     #argParser.add_argument('--outJSON', required=True, help='path to directory for storing the output CSV File, containing k-means cluster assignments')
     argParser.add_argument('--accept', nargs='+', type=str, help='Optional: compute similarity only on specified IANA MIME Type(s)')
-    argParser.add_argument('--measure', type=int, help='Optional: 0 - Euclidean, 1 - Cosine, 2 - Edit (default: 0)')
+    argParser.add_argument('--cache', default=DEFAULT_CACHE, help='Optional: path to the Tika metadata cache (default: %(default)s)')
+    argParser.add_argument('--tikaServer', help='Optional: URL of the Tika server (default: local tika-python server)')
+    argParser.add_argument('--tikaWorkers', type=int, default=4, help='Optional: number of concurrent Tika requests (default: %(default)s)')
+    argParser.add_argument('--tikaTimeout', type=float, default=300, help='Optional: seconds to wait for Tika to answer a request before retrying (default: %(default)s)')
+    argParser.add_argument('--measure', type=int, help='Optional: 0 - Euclidean, 1 - Cosine, 2 - Edit, 3 - Jaccard (default: 0)')
+    argParser.add_argument('--compact', action='store_true', help='Optional: use the array-backed CompactVector to cut memory on large corpora')
+    argParser.add_argument('--distanceFile', help='Optional: memory-map the point-to-point distance matrix to this file')
+    argParser.add_argument('--precompute', action='store_true', help='Optional: compute all point-to-point distances before clustering')
+    argParser.add_argument('--workers', type=int, default=1, help='Optional: number of processes computing distances and running restarts (default: %(default)s)')
+    argParser.add_argument('--maxIterations', type=int, default=300, help='Optional: maximum reassignment iterations of each k-means run (default: %(default)s)')
+    argParser.add_argument('--tolerance', type=float, default=0.0, help='Optional: stop a run once the distortion improves by less than this (default: stop when assignments stop changing)')
+    argParser.add_argument('--medoids', choices=['exhaustive', 'incremental'], default='exhaustive', help='Optional: clustroid update, "incremental" reuses per-point distance sums between iterations (default: %(default)s)')
+    argParser.add_argument('--seed', type=int, help='Optional: seed of the random restarts, for reproducible clusters')
+    argParser.add_argument('--init', choices=['random', 'kmeans++'], default='random', help='Optional: choice of the initial centroids (default: %(default)s)')
+    argParser.add_argument('--restarts', type=int, default=51, help='Optional: number of random restarts for each k (default: %(default)s)')
+    argParser.add_argument('--patience', type=int, help='Optional: stop the restarts of a k once its best distortion has not improved over PATIENCE runs')
+    argParser.add_argument('--noBounds', action='store_true', help='Optional: compare every point with every centroid, even for the metric measures (Euclidean, Jaccard)')
     args = argParser.parse_args()
+
+    if args.tikaWorkers < 1:
+        argParser.error('--tikaWorkers must be at least 1')
+    if args.tikaTimeout <= 0:
+        argParser.error('--tikaTimeout must be positive')
+    if args.restarts < 1:
+        argParser.error('--restarts must be at least 1')
     
 
     if args.inputDir:# and args.outJSON:
 
-        list_of_points = []
-        for eachFile in filterFiles(args.inputDir, args.accept):
-            metadata = parser.from_file(eachFile)["metadata"]
-            
-            if len(metadata) == 0:
-                continue
-            
-            list_of_points.append(Vector(eachFile, metadata))
+        cache = MetadataCache(args.cache)
+        try:
+            corpus = Corpus(args.inputDir, args.accept, cache, CompactVector if args.compact else Vector, TikaClient(args.tikaServer, args.tikaWorkers, readTimeout=args.tikaTimeout))
+        finally:
+            cache.close()
+
+        file_metadata = dict(zip(corpus.filenames, corpus.metadata))
+        list_of_points = [point for point, metadata in zip(corpus.vectors, corpus.metadata) if len(metadata) > 0]
         
         for point in list_of_points:
             union_features |= set(point.features.keys())
 
-        true_global_minima = K_Means_iter(list_of_points)   
+        true_global_minima = K_Means_iter(list_of_points, args.measure, None, args.distanceFile, args.precompute, args.workers,
+                                          args.maxIterations, args.tolerance, args.medoids, args.seed,
+                                          args.init, args.restarts, args.patience, not args.noBounds)
 
         with open("clusters.json", "w") as jsonF:
 
@@ -288,7 +569,7 @@ if __name__ == "__main__":
                 for point in true_global_minima[1][key]:
 
                     node = {}
-                    node["metadata"] = json.dumps(parser.from_file(point.filename)["metadata"])
+                    node["metadata"] = json.dumps(file_metadata[point.filename])
                     node["name"] = point.filename.split('/')[-1]
                     node["path"] = point.filename
                     children.append(node)
@@ -0,0 +1,155 @@
+#!/usr/bin/env python2.7
+#
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+
+# Persistent cache of Tika metadata, shared by the similarity and clustering scripts
+
+from tika_client import TikaClient
+import os, json, sqlite3
+
+DEFAULT_CACHE = ".tika-metadata-cache.db"
+
+
+class MetadataCache:
+    '''
+    SQLite backed store of the parsed Tika "metadata" dict of each file.
+
+    Entries are keyed by absolute path and are only reused while the file
+    size and modification time are unchanged, so re-running a script over
+    an unchanged directory does not call Tika at all. Files Tika rejected
+    are stored as None; transient failures are not stored, so those files
+    are retried on the next run.
+    '''
+    commitEvery = 100
+    # bumped whenever the shape of the stored metadata changes
+    version = 2
+
+    def __init__(self, path=DEFAULT_CACHE, client=None):
+        '''
+        Open (or create) a cache
+        @param path sqlite file, or None for a throw-away in-memory cache
+        @param client TikaClient used on cache misses
+               (default: a single-worker client of the local server)
+        '''
+        self.path = path or ":memory:"
+        self.db = sqlite3.connect(self.path)
+        self.db.execute("CREATE TABLE IF NOT EXISTS metadata ("
+                        "path TEXT PRIMARY KEY, size INTEGER, mtime REAL, metadata TEXT)")
+        if self.db.execute("PRAGMA user_version").fetchone()[0] != self.version:
+            self.db.execute("DELETE FROM metadata")
+            self.db.execute("PRAGMA user_version = %d" % self.version)
+            self.db.commit()
+        self.pending = 0
+        self.client = client
+
+
+    def fileKey(self, filename):
+        st = os.stat(filename)
+        path = os.path.abspath(filename)
+        # filenames are byte strings, kept as latin-1 so any bytes round-trip
+        if not isinstance(path, unicode):
+            path = path.decode('latin-1')
+        return path, st.st_size, st.st_mtime
+
+
+    def get(self, filename):
+        r'''
+        Return (found, metadata) without calling Tika.
+        metadata is None for files Tika rejected.
+
+        >>> import tempfile, shutil
+        >>> directory = tempfile.mkdtemp()
+        >>> filename = os.path.join(directory, 'caf\xc3\xa9 \xe9.txt')
+        >>> open(filename, 'w').close()
+        >>> cache = MetadataCache(None)
+        >>> cache.put(filename, {u'Content-Type': u'text/plain'})
+        >>> cache.get(filename)
+        (True, {u'Content-Type': u'text/plain'})
+        >>> shutil.rmtree(directory)
+        '''
+        path, size, mtime = self.fileKey(filename)
+        row = self.db.execute("SELECT size, mtime, metadata FROM metadata WHERE path = ?", (path,)).fetchone()
+        if row is None or row[0] != size or row[1] != mtime:
+            return False, None
+        return True, json.loads(row[2])
+
+
+    def cached(self, filename):
+        path, size, mtime = self.fileKey(filename)
+        row = self.db.execute("SELECT size, mtime FROM metadata WHERE path = ?", (path,)).fetchone()
+        return row is not None and row[0] == size and row[1] == mtime
+
+
+    def put(self, filename, metadata):
+        '''
+        Store the metadata of filename; None marks a file Tika rejected
+        '''
+        path, size, mtime = self.fileKey(filename)
+        self.db.execute("INSERT OR REPLACE INTO metadata (path, size, mtime, metadata) VALUES (?, ?, ?, ?)",
+                        (path, size, mtime, json.dumps(metadata)))
+        self.pending += 1
+        if self.pending >= self.commitEvery:
+            self.commit()
+
+
+    def metadata(self, filename):
+        '''
+        Metadata dict of filename, extracted by Tika only on a cache miss,
+        or None when Tika cannot parse it.
+        A fresh dict is returned on every call, so callers may modify it.
+        '''
+        found, metadata = self.get(filename)
+        if not found:
+            metadata, final = self.tikaClient().extract(filename)
+            if final:
+                self.put(filename, metadata)
+        return metadata
+
+
+    def fill(self, filenames, client=None):
+        '''
+        Extract every file of filenames missing from the cache, concurrently,
+        and store the final results; nothing is kept in memory
+        @param client TikaClient to extract with (default: the cache's own)
+        '''
+        missing = [filename for filename in filenames if not self.cached(filename)]
+        if not missing:
+            return
+
+        client = client or self.tikaClient()
+        print "Extracting metadata of", len(missing), "files with", client.workers, "Tika workers....."
+        for filename, metadata, final in client.extractAll(missing):
+            if final:
+                self.put(filename, metadata)
+        self.commit()
+
+
+    def tikaClient(self):
+        if self.client is None:
+            self.client = TikaClient(workers=1)
+        return self.client
+
+
+    def commit(self):
+        self.db.commit()
+        self.pending = 0
+
+
+    def close(self):
+        self.commit()
+        self.db.close()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python2.7
+#
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+
+# MinHash signatures and banded LSH for Jaccard candidate generation
+
+import numpy as np
+import itertools, json, zlib
+
+PRIME = (1 << 32) + 15          # smallest prime above 2^32
+MAX_HASH = (1 << 32) - 1
+
+def metadataTokens(metadata):
+    '''
+    Set elements of a document: its key=value pairs, whose Jaccard index
+    is exactly jaccard_similarity.py's score
+    '''
+    return [key + u"=" + json.dumps(value, sort_keys=True) for key, value in metadata.iteritems()]
+
+
+def approximateThreshold(bands, rows):
+    return (1.0 / bands) ** (1.0 / rows)
+
+
+def optimalBands(threshold, numPerm):
+    '''
+    (bands, rows) with bands * rows == numPerm whose S-curve midpoint is the
+    highest one not above threshold, so pairs at the threshold are likely
+    to become candidates
+    '''
+    layouts = [(numPerm // rows, rows) for rows in range(1, numPerm + 1) if numPerm % rows == 0]
+    below = [layout for layout in layouts if approximateThreshold(*layout) <= threshold]
+    if not below:
+        return min(layouts, key=lambda layout: approximateThreshold(*layout))
+    return max(below, key=lambda layout: approximateThreshold(*layout))
+
+
+class MinHash:
+    '''
+    numPerm universal hash functions (a * x + b) mod PRIME over 32 bit token hashes
+    '''
+
+    def __init__(self, numPerm=128, seed=1):
+        random = np.random.RandomState(seed)
+        self.numPerm = numPerm
+        self.a = random.randint(1, 1 << 31, numPerm).astype(np.uint64)
+        self.b = random.randint(0, 1 << 31, numPerm).astype(np.uint64)
+
+    def signature(self, tokens):
+        signature = np.empty(self.numPerm, dtype=np.uint32)
+        signature.fill(MAX_HASH)
+        if not tokens:
+            return signature
+
+        hashes = np.array([zlib.crc32(token.encode('utf-8')) & MAX_HASH for token in tokens], dtype=np.uint64)
+        permuted = (hashes[:, np.newaxis] * self.a + self.b) % PRIME
+        return np.minimum(permuted.min(axis=0), MAX_HASH).astype(np.uint32)
+
+
+class LSHIndex:
+    '''
+    Banded LSH over MinHash signatures: documents sharing all rows of any
+    band land in the same bucket and become candidate pairs
+    '''
+
+    def __init__(self, threshold, numPerm=128):
+        self.bands, self.rows = optimalBands(threshold, numPerm)
+        self.buckets = [{} for band in range(self.bands)]
+        self.signatures = {}
+
+    def add(self, docId, signature):
+        self.signatures[docId] = signature
+        for band in range(self.bands):
+            key = signature[band * self.rows:(band + 1) * self.rows].tobytes()
+            self.buckets[band].setdefault(key, []).append(docId)
+
+    def candidatePairs(self):
+        '''
+        Yield every distinct (i, j), i < j, sharing at least one bucket,
+        one bucket at a time. A pair is only yielded by the first band it
+        collides in, so no set of the pairs seen so far is kept.
+        '''
+        for band, buckets in enumerate(self.buckets):
+            earlierRows = band * self.rows
+            for docIds in buckets.itervalues():
+                if len(docIds) < 2:
+                    continue
+                docIds = sorted(docIds)
+                earlier = np.array([self.signatures[docId][:earlierRows] for docId in docIds])
+                for m, i in enumerate(docIds[:-1]):
+                    others = docIds[m + 1:]
+                    if band:
+                        # pairs colliding in an earlier band were yielded there
+                        collided = (earlier[m + 1:] == earlier[m]).reshape(len(others), band, self.rows).all(axis=2).any(axis=1)
+                        others = itertools.compress(others, ~collided)
+                    for j in others:
+                        yield i, j
@@ -0,0 +1,142 @@
+#!/usr/bin/env python2.7
+#
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+
+# Streaming conversion of pair scores into the cluster/circle packing JSON
+# shared by edit-cosine-cluster.py and edit-cosine-circle-packing.py
+
+from score_store import isScoreStore, ScoreStore
+from operator import itemgetter
+import csv, heapq, itertools, json, os, tempfile
+
+DEFAULT_MAX_ROWS = 500000
+
+
+class UngroupedInput(Exception):
+    '''
+    Raised when the rows of one x-coordinate are not consecutive
+    '''
+
+
+def readPairs(path):
+    '''
+    Yield (x, y, score) string triples from a pair CSV (with or without its
+    header) or from a binary score store
+    '''
+    if isScoreStore(path):
+        for x, y, score in ScoreStore(path):
+            yield x, y, "%.7g" % score
+        return
+
+    with open(path, "rb") as f:
+        reader = csv.reader(f)
+        for row in reader:
+            if row[:2] == ["x-coordinate", "y-coordinate"]:
+                continue
+            yield row[0], row[1], row[2]
+
+
+def consecutiveGroups(pairs):
+    '''
+    Yield (x, rows) for every run of pairs sharing x, in one pass
+    @raise UngroupedInput once an x shows up again after its run
+    '''
+    seen = set()
+    for x, rows in itertools.groupby(pairs, itemgetter(0)):
+        if x in seen:
+            raise UngroupedInput(x)
+        seen.add(x)
+        yield x, rows
+
+
+def _readRun(runF):
+    runF.seek(0)
+    for x, seq, y, score in csv.reader(runF):
+        yield x, int(seq), y, score
+
+
+def sortedPairs(pairs, maxRows=DEFAULT_MAX_ROWS):
+    '''
+    pairs ordered by x, keeping the input order within an x. Sorted in
+    memory when they fit in maxRows rows, else by an external merge sort of
+    sorted runs of maxRows rows spilled to temporary files.
+    '''
+    pairs = ((x, seq, y, score) for seq, (x, y, score) in enumerate(pairs))
+
+    runs = []
+    try:
+        chunk = sorted(itertools.islice(pairs, maxRows))
+        if len(chunk) < maxRows:        # everything fits
+            merged = iter(chunk)
+        else:
+            while chunk:
+                runF = tempfile.TemporaryFile()
+                csv.writer(runF).writerows(chunk)
+                runs.append(runF)
+                chunk = sorted(itertools.islice(pairs, maxRows))
+            merged = heapq.merge(*[_readRun(runF) for runF in runs])
+
+        for x, seq, y, score in merged:
+            yield x, y, score
+    finally:
+        for runF in runs:
+            runF.close()
+
+
+def writeGroups(groups, outF):
+    '''
+    Write {"children": [cluster, ...], "name": "clusters"} to outF one child
+    at a time, where cluster i lists the (y, score) pairs of the i-th group
+    @return number of clusters
+    '''
+    count = 0
+    outF.write('{"children": [')
+    for x, rows in groups:
+        if count:
+            outF.write(', ')
+        outF.write('{"children": [')
+        for m, (x, y, score) in enumerate(rows):
+            if m:
+                outF.write(', ')
+            outF.write(json.dumps({"name": y + "  " + score, "size": score}, sort_keys=True))
+        outF.write('], "name": ' + json.dumps("cluster " + str(count)) + '}')
+        count += 1
+    outF.write('], "name": "clusters"}')
+    return count
+
+
+def writeClusterJSON(pairsPath, outJSON, maxRows=DEFAULT_MAX_ROWS):
+    '''
+    One cluster per x-coordinate of the pairs in pairsPath (CSV or binary
+    score store), listing its y-coordinates and scores, streamed to outJSON.
+
+    Pair files written by the similarity scripts keep the rows of an x
+    together and are converted in a single pass; otherwise the rows are
+    sorted by x first (externally when there are more than maxRows).
+    '''
+    tmpJSON = outJSON + ".tmp"
+    try:
+        with open(tmpJSON, "wb") as outF:
+            count = writeGroups(consecutiveGroups(readPairs(pairsPath)), outF)
+    except UngroupedInput:
+        print "Rows of an x-coordinate are not consecutive, sorting " + pairsPath + "....."
+        with open(tmpJSON, "wb") as outF:
+            count = writeGroups(itertools.groupby(sortedPairs(readPairs(pairsPath), maxRows), itemgetter(0)), outF)
+
+    os.rename(tmpJSON, outJSON)
+    print "Wrote", count, "clusters to", outJSON
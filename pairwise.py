@@ -0,0 +1,294 @@
+#!/usr/bin/env python2.7
+#
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+
+# Memory-bounded all-pairs driver shared by the pairwise similarity scripts
+
+from score_store import ScoreStoreWriter
+import numpy as np
+from multiprocessing import Pool
+from collections import deque
+import itertools, heapq, csv
+
+DEFAULT_BLOCK_ROWS = 1024
+BYTES_PER_SCORE = 24        # float64 block plus the sparse product it is built from
+
+def blockRows(n, blockSize=None, memoryBudget=None, workers=1):
+    '''
+    Number of rows scored at once: blockSize if given, else as many rows
+    of n scores as fit in memoryBudget megabytes (shared by all workers).
+    With several workers blocks are kept small enough to spread the
+    upper triangle over at least 4 tasks per worker.
+    '''
+    if blockSize:
+        return blockSize
+    rows = DEFAULT_BLOCK_ROWS
+    if memoryBudget:
+        inFlight = 2 * workers if workers > 1 else 1
+        rows = max(1, int(memoryBudget * 2 ** 20 // (max(n, 1) * BYTES_PER_SCORE * inFlight)))
+    if workers > 1:
+        rows = max(1, min(rows, n // (4 * workers)))
+    return rows
+
+
+class PairFunctionScorer:
+    '''
+    Block scorer calling pairScore(items[i], items[j]) for every i < j.
+    Entries on and below the diagonal are left as NaN.
+    '''
+
+    def __init__(self, items, pairScore):
+        self.items = items
+        self.pairScore = pairScore
+
+    def __len__(self):
+        return len(self.items)
+
+    def similarities(self, start, stop, colStart=0, colStop=None):
+        if colStop is None:
+            colStop = len(self.items)
+        block = np.empty((stop - start, colStop - colStart))
+        block.fill(np.nan)
+        for i in range(start, stop):
+            item = self.items[i]
+            for j in range(max(i + 1, colStart), colStop):
+                block[i - start, j - colStart] = self.pairScore(item, self.items[j])
+        return block
+
+
+_sharedScorer = None
+
+def _scoreBlock(start, stop, colStart):
+    return start, stop, colStart, _sharedScorer.similarities(start, stop, colStart)
+
+
+def scoreBlocks(scorer, blocks, workers=1):
+    '''
+    Yield (start, stop, colStart, block) for every (start, stop, colStart) of
+    blocks, where block holds rows start:stop against columns colStart:n.
+
+    With workers > 1 blocks are scored by a forked process pool that
+    inherits the scorer instead of receiving a pickled copy per task; blocks
+    are still yielded in order and at most 2 x workers are in flight.
+    '''
+    global _sharedScorer
+
+    if workers <= 1:
+        for start, stop, colStart in blocks:
+            yield start, stop, colStart, scorer.similarities(start, stop, colStart)
+        return
+
+    _sharedScorer = scorer
+    pool = Pool(workers)
+    try:
+        pending = deque()
+        for start, stop, colStart in blocks:
+            pending.append(pool.apply_async(_scoreBlock, (start, stop, colStart)))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+    finally:
+        pool.terminate()
+        _sharedScorer = None
+
+
+def upperTriangleBlocks(scorer, blockSize=DEFAULT_BLOCK_ROWS, workers=1):
+    '''
+    Yield (start, stop, block) for consecutive row blocks of a scorer, where
+    block[r, c] scores rows start + r and start + c; only c > r is meaningful.
+    '''
+    n = len(scorer)
+    blocks = ((start, min(start + blockSize, n), start) for start in range(0, n, blockSize))
+    for start, stop, colStart, block in scoreBlocks(scorer, blocks, workers):
+        yield start, stop, block
+
+
+def upperTriangleMask(block):
+    '''
+    Copy of an upper triangle block with every entry outside i < j set to -inf
+    '''
+    rows = block.shape[0]
+    masked = np.where(np.isnan(block), -np.inf, block)
+    masked[:, :rows][np.tril_indices(rows)] = -np.inf
+    return masked
+
+
+def topIndices(values, k):
+    '''
+    Indices of the k largest finite values, lowest index first among ties
+    '''
+    if len(values) > k:
+        kth = np.partition(values, len(values) - k)[len(values) - k]
+        above = np.flatnonzero(values > kth)
+        ties = np.flatnonzero(values == kth)[:k - len(above)]
+        indices = np.concatenate((above, ties))
+    else:
+        indices = np.arange(len(values))
+    return indices[np.isfinite(values[indices])]
+
+
+class TopKNeighbours:
+    '''
+    Keeps the k most similar neighbours of every document in one bounded
+    min-heap of (score, -neighbour) per document, so ties always go to the
+    lowest neighbour index whatever the block layout.
+    '''
+
+    def __init__(self, n, k, minScore=None):
+        if k < 1:
+            raise ValueError("k must be at least 1, got " + str(k))
+        self.k = k
+        self.minScore = -np.inf if minScore is None else minScore
+        self.heaps = [[] for i in range(n)]
+
+    def push(self, i, scores, neighbours):
+        heap = self.heaps[i]
+        for score, j in itertools.izip(scores, neighbours):
+            if score < self.minScore:
+                continue
+            entry = (score, -j)
+            if len(heap) < self.k:
+                heapq.heappush(heap, entry)
+            elif entry > heap[0]:
+                heapq.heapreplace(heap, entry)
+
+    def addBlock(self, start, block):
+        '''
+        Offer the i < j pairs of an upper triangle block to both documents.
+        Only the k best candidates per row and per column of the block are
+        pushed, so heap traffic is O(k) per document per block.
+        '''
+        block = upperTriangleMask(block)
+        rows, cols = block.shape
+
+        for r in range(rows):
+            best = topIndices(block[r], self.k)
+            self.push(start + r, block[r, best].tolist(), (start + best).tolist())
+
+        for c in range(cols):
+            best = topIndices(block[:, c], self.k)
+            if len(best):
+                self.push(start + c, block[best, c].tolist(), (start + best).tolist())
+
+    def neighbours(self):
+        '''
+        Yield (i, j, score) for every document i, most similar j first
+        '''
+        for i, heap in enumerate(self.heaps):
+            for score, j in sorted(heap, reverse=True):
+                yield i, -j, score
+
+
+class CSVPairWriter:
+    '''
+    Writes pair scores as x-coordinate,y-coordinate,Similarity_score rows
+    '''
+
+    def __init__(self, outF, filenames, header=True):
+        self.writer = csv.writer(outF, delimiter=',')
+        self.filenames = filenames
+        if header:
+            self.writer.writerow(["x-coordinate","y-coordinate","Similarity_score"])
+
+    def writeRange(self, i, first, scores):
+        '''
+        Pairs (i, first + m, scores[m]) for every m
+        '''
+        self.writer.writerows(itertools.izip(itertools.repeat(self.filenames[i]), self.filenames[first:first + len(scores)], scores.tolist()))
+
+    def writeTriples(self, triples):
+        '''
+        Pairs (i, j, score) of an iterable
+        '''
+        filenames = self.filenames
+        self.writer.writerows((filenames[i], filenames[j], score) for i, j, score in triples)
+
+    def close(self):
+        pass
+
+
+def pairWriter(outF, filenames, outFormat="csv", header=True):
+    '''
+    Writer of pair scores to outF in outFormat, "csv" or "binary" (see score_store)
+    '''
+    if outFormat == "binary":
+        return ScoreStoreWriter(outF, filenames)
+    return CSVPairWriter(outF, filenames, header)
+
+
+def writeScores(pairs, i, first, scores, minScore=None):
+    '''
+    Write the pairs (i, first + m) of scores, dropping those below minScore
+    '''
+    if minScore is None:
+        pairs.writeRange(i, first, scores)
+    else:
+        with np.errstate(invalid='ignore'):         # NaN scores are dropped
+            keep = np.flatnonzero(scores >= minScore)
+        pairs.writeTriples(itertools.izip(itertools.repeat(i), (keep + first).tolist(), scores[keep].tolist()))
+
+
+def writeUpperTriangle(scorer, filenames, outF, blockSize=DEFAULT_BLOCK_ROWS, topK=None, minScore=None, workers=1, outFormat="csv"):
+    '''
+    Stream pair scores to outF, as x-coordinate,y-coordinate,Similarity_score
+    rows or as a binary score store (outFormat "binary").
+
+    By default every i < j pair is written in itertools.combinations order;
+    minScore drops pairs scoring below it, and topK instead writes the topK
+    most similar neighbours of each document (so a pair can appear as both
+    i,j and j,i). workers scores blocks in parallel; output is identical.
+    '''
+    pairs = pairWriter(outF, filenames, outFormat)
+
+    if topK:
+        topNeighbours = TopKNeighbours(len(scorer), topK, minScore)
+        for start, stop, block in upperTriangleBlocks(scorer, blockSize, workers):
+            topNeighbours.addBlock(start, block)
+        pairs.writeTriples(topNeighbours.neighbours())
+    else:
+        for start, stop, block in upperTriangleBlocks(scorer, blockSize, workers):
+            for i in range(start, stop):
+                writeScores(pairs, i, i + 1, block[i - start, i + 1 - start:], minScore)
+
+    pairs.close()
+
+
+def writeRowPairs(scorer, filenames, positions, outF, rows, blockSize=DEFAULT_BLOCK_ROWS, minScore=None, workers=1):
+    '''
+    Stream the scores of every pair involving one of the first rows documents
+    of scorer to outF, without a header: the i < j pairs of rows 0:rows.
+    Costs O(rows x n) scores.
+    @param positions corpus index of each scorer document; a pair is written
+           with its lower corpus index first, as writeUpperTriangle writes it
+    '''
+    pairs = CSVPairWriter(outF, filenames, header=False)
+    positions = np.asarray(positions)
+
+    blocks = ((start, min(start + blockSize, rows), start) for start in range(0, rows, blockSize))
+    for start, stop, colStart, block in scoreBlocks(scorer, blocks, workers):
+        for i in range(start, stop):
+            scores = block[i - start, i + 1 - start:]
+            others = positions[i + 1:]
+            if minScore is not None:
+                with np.errstate(invalid='ignore'):         # NaN scores are dropped
+                    keep = np.flatnonzero(scores >= minScore)
+                scores, others = scores[keep], others[keep]
+            first = np.minimum(others, positions[i])
+            second = np.maximum(others, positions[i])
+            pairs.writeTriples(itertools.izip(first.tolist(), second.tolist(), scores.tolist()))
@@ -0,0 +1,166 @@
+#!/usr/bin/env python2.7
+#
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+
+# Incremental maintenance of a pairwise score CSV as files come and go
+
+from pairwise import writeUpperTriangle, writeRowPairs, blockRows
+import os, csv, json
+
+
+def fileStat(filename):
+    st = os.stat(filename)
+    return [st.st_size, st.st_mtime]
+
+
+class ScoreManifest:
+    '''
+    The files (with size and modification time) and the options a score CSV
+    was computed from, stored as JSON next to it (OUTCSV.manifest).
+    '''
+
+    def __init__(self, outCSV):
+        self.outCSV = outCSV
+        self.path = outCSV + ".manifest"
+        self.files = {}
+        self.options = None
+        self.output = None
+
+        if os.path.exists(self.path):
+            with open(self.path, "rb") as manifestF:
+                manifest = json.load(manifestF)
+            # filenames are byte strings, kept as latin-1 so any bytes round-trip
+            self.files = dict((filename.encode('latin-1'), stat) for filename, stat in manifest["files"].iteritems())
+            self.options = manifest["options"]
+            self.output = manifest["output"]
+
+
+    def changes(self, files, options):
+        '''
+        Return (dirty, deleted) filenames of files, a dict of filename ->
+        fileStat, against the manifest, or None if the CSV has to be computed
+        from scratch (no manifest, other options, CSV missing or modified)
+        '''
+        if self.options != options or not os.path.exists(self.outCSV) or fileStat(self.outCSV) != self.output:
+            return None
+
+        dirty = set(filename for filename, stat in files.iteritems() if self.files.get(filename) != stat)
+        deleted = set(self.files) - set(files)
+        return dirty, deleted
+
+
+    def save(self, files, options):
+        self.files = files
+        self.options = options
+        self.output = fileStat(self.outCSV)
+        with open(self.path, "wb") as manifestF:
+            json.dump({"files": self.files, "options": self.options, "output": self.output}, manifestF, encoding='latin-1')
+
+
+def updateScores(corpus, scorerFactory, outCSV, options, blockSize=None, memoryBudget=None, minScore=None, workers=1):
+    '''
+    Bring outCSV up to date with corpus. Rows of changed and deleted files
+    are dropped, and only the pairs involving new or changed files are
+    scored and appended, so a run costs O(changed x n) scores; when files
+    were only added the CSV is appended to in place. Pairs keep the
+    orientation of a full run. Without a usable manifest every pair is
+    computed.
+    @param scorerFactory callable(vectors) returning a block scorer
+           (see pairwise.writeUpperTriangle)
+    @param options dict of everything else the scores depend on
+    '''
+    manifest = ScoreManifest(outCSV)
+    files = dict((filename, fileStat(filename)) for filename in corpus.filenames)
+    changes = manifest.changes(files, options)
+
+    if changes is None:
+        print "No usable manifest for " + outCSV + ", scoring all pairs....."
+        tmpCSV = outCSV + ".tmp"
+        with open(tmpCSV, "wb") as outF:
+            writeUpperTriangle(scorerFactory(corpus.vectors), corpus.filenames, outF,
+                               blockRows(len(corpus), blockSize, memoryBudget, workers), None, minScore, workers)
+        os.rename(tmpCSV, outCSV)
+        manifest.save(files, options)
+        return
+
+    dirty, deleted = changes
+    print len(dirty), "new or changed and", len(deleted), "deleted files since the last run....."
+
+    # only changed and deleted files have rows to drop
+    stale = (dirty & set(manifest.files)) | deleted
+    if stale:
+        tmpCSV = outCSV + ".tmp"
+        with open(outCSV, "rb") as inF:
+            with open(tmpCSV, "wb") as outF:
+                reader = csv.reader(inF)
+                writer = csv.writer(outF, delimiter=',')
+                writer.writerow(next(reader))
+                writer.writerows(row for row in reader if row[0] not in stale and row[1] not in stale)
+                appendScores(corpus, scorerFactory, dirty, outF, blockSize, memoryBudget, minScore, workers)
+        os.rename(tmpCSV, outCSV)
+    elif dirty:
+        with open(outCSV, "ab") as outF:
+            appendScores(corpus, scorerFactory, dirty, outF, blockSize, memoryBudget, minScore, workers)
+
+    manifest.save(files, options)
+
+
+def appendScores(corpus, scorerFactory, dirty, outF, blockSize=None, memoryBudget=None, minScore=None, workers=1):
+    '''
+    Write every pair of corpus involving a file of dirty, lower corpus index first
+    '''
+    # documents to score go first, so their pairs are the rows 0:len(dirty)
+    order = [i for i, filename in enumerate(corpus.filenames) if filename in dirty]
+    rows = len(order)
+    if not rows:
+        return
+    order += [i for i, filename in enumerate(corpus.filenames) if filename not in dirty]
+
+    writeRowPairs(scorerFactory([corpus.vectors[i] for i in order]), corpus.filenames, order, outF, rows,
+                  blockRows(len(order), blockSize, memoryBudget, workers), minScore, workers)
+
+
+def readScores(path):
+    with open(path, "rb") as inF:
+        reader = csv.reader(inF)
+        next(reader)
+        return dict(((row[0], row[1]), float(row[2])) for row in reader)
+
+
+def checkScores(corpus, scorerFactory, outCSV, blockSize=None, memoryBudget=None, minScore=None, workers=1, tolerance=1e-9):
+    '''
+    Rescore every pair of corpus and compare with the rows of outCSV,
+    whatever their order. Costs O(n^2) scores, so it is meant for checking
+    that an --incremental run matches a full one.
+    @return number of pairs missing from either file or whose scores differ
+            by more than tolerance
+    '''
+    checkCSV = outCSV + ".check"
+    try:
+        with open(checkCSV, "wb") as outF:
+            writeUpperTriangle(scorerFactory(corpus.vectors), corpus.filenames, outF,
+                               blockRows(len(corpus), blockSize, memoryBudget, workers), None, minScore, workers)
+        expected = readScores(checkCSV)
+    finally:
+        os.remove(checkCSV)
+
+    found = readScores(outCSV)
+    differing = len(set(expected) ^ set(found))
+    differing += sum(1 for pair, score in expected.iteritems()
+                     if pair in found and abs(found[pair] - score) > tolerance)
+    return differing
@@ -0,0 +1,116 @@
+#!/usr/bin/env python2.7
+#
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+
+# Compact binary alternative to the pairwise score CSV
+#
+# Layout: MAGIC, then one (int32 i, int32 j, float32 score) little-endian
+# record per pair, then the JSON list of filenames that i and j index,
+# then a trailer of (uint64 JSON length, uint64 record count, MAGIC).
+
+import numpy as np
+import itertools, json, struct
+
+MAGIC = "TIKASCR\x01"
+RECORD = np.dtype([('i', '<i4'), ('j', '<i4'), ('score', '<f4')])
+TRAILER = struct.Struct("<QQ8s")
+CHUNK = 65536
+
+
+def isScoreStore(path):
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+class ScoreStoreWriter:
+    '''
+    Streams pair scores to a binary score store; the filenames are written
+    once, after the records, when the writer is closed
+    '''
+
+    def __init__(self, outF, filenames):
+        self.outF = outF
+        self.filenames = filenames
+        self.count = 0
+        outF.write(MAGIC)
+
+    def writeRecords(self, records):
+        self.outF.write(records.tostring())
+        self.count += len(records)
+
+    def writeRange(self, i, first, scores):
+        '''
+        Pairs (i, first + m, scores[m]) for every m
+        '''
+        records = np.empty(len(scores), dtype=RECORD)
+        records['i'] = i
+        records['j'] = np.arange(first, first + len(scores))
+        records['score'] = scores
+        self.writeRecords(records)
+
+    def writeTriples(self, triples):
+        '''
+        Pairs (i, j, score) of an iterable
+        '''
+        triples = iter(triples)
+        while True:
+            chunk = list(itertools.islice(triples, CHUNK))
+            if not chunk:
+                break
+            self.writeRecords(np.array(chunk, dtype=RECORD))
+
+    def close(self):
+        # filenames are byte strings, kept as latin-1 so any bytes round-trip
+        dictionary = json.dumps(self.filenames, encoding='latin-1')
+        self.outF.write(dictionary)
+        self.outF.write(TRAILER.pack(len(dictionary), self.count, MAGIC))
+
+
+class ScoreStore:
+    '''
+    Read-only view of a binary score store. records is a memory-mapped
+    structured array with fields i, j and score, so loading is O(1) and
+    columns can be processed with numpy without parsing anything.
+    '''
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            f.seek(-TRAILER.size, 2)
+            dictionaryLength, count, magic = TRAILER.unpack(f.read(TRAILER.size))
+            if magic != MAGIC:
+                raise ValueError(path + " is not a complete score store")
+            f.seek(len(MAGIC) + count * RECORD.itemsize)
+            self.filenames = [filename.encode('latin-1') for filename in json.loads(f.read(dictionaryLength))]
+
+        if count:
+            self.records = np.memmap(path, dtype=RECORD, mode='r', offset=len(MAGIC), shape=(count,))
+        else:
+            self.records = np.empty(0, dtype=RECORD)
+
+    def __len__(self):
+        return len(self.records)
+
+    def __iter__(self):
+        '''
+        Yield (filename, filename, score) for every pair, in stored order
+        '''
+        filenames = self.filenames
+        for start in range(0, len(self.records), CHUNK):
+            chunk = self.records[start:start + CHUNK]
+            for i, j, score in itertools.izip(chunk['i'].tolist(), chunk['j'].tolist(), chunk['score'].tolist()):
+                yield filenames[i], filenames[j], score
@@ -17,15 +17,14 @@
 #
 #
 
-import tika
-from tika import parser
 import os
 import sys
 import getopt
-import json
 import operator
-from time import sleep
-from requests import ConnectionError 
+from similarity_scores import writeScores
+from metadata_cache import MetadataCache, DEFAULT_CACHE
+from tika_client import TikaClient
+from corpus import mimeSubtype
 
 _verbose = False
 _helpMessage = '''
@@ -47,6 +46,18 @@ Options:
 --accept [jpeg pdf etc...]
 	Optional: compute similarity only on specified IANA MIME Type(s)
 
+--cache [path]
+	Optional: path to the Tika metadata cache (default: .tika-metadata-cache.db)
+
+--tikaServer [url]
+	Optional: URL of the Tika server (default: local tika-python server)
+
+--tikaWorkers [number]
+	Optional: number of concurrent Tika requests (default: 4)
+
+--tikaTimeout [seconds]
+	Optional: seconds to wait for Tika to answer a request before retrying (default: 300)
+
 -h --help
 	show help on the screen
 '''
@@ -61,13 +72,22 @@ class _Usage(Exception):
 	def __init__(self, msg):
 		self.msg = msg
 
+class _CachedMetadata:
+	''' metadata of the scored files, read back from the cache on lookup '''
+
+	def __init__(self, cache):
+		self.cache = cache
+
+	def __getitem__(self, filename):
+		return self.cache.get(filename)[1]
+
 def main(argv = None):
 	if argv is None:
 		argv = sys.argv
 
 	try:
 		try:
-			opts, args = getopt.getopt(argv[1:], 'hvf:c:a:', ['help', 'verbose', 'directory=', 'file=', 'accept=' ])
+			opts, args = getopt.getopt(argv[1:], 'hvf:c:a:', ['help', 'verbose', 'directory=', 'file=', 'accept=', 'cache=', 'tikaServer=', 'tikaWorkers=', 'tikaTimeout=' ])
 		except getopt.error, msg:
 			raise _Usage(msg)
 
@@ -79,6 +99,10 @@ def main(argv = None):
 		filename_list = []
 		allowed_mime_types = []
 		directory_flag = 0
+		cache_path = DEFAULT_CACHE
+		tika_server = None
+		tika_workers = 4
+		tika_timeout = 300
 
 		for option, value in opts:
 			if option in ('-h', '--help'):
@@ -106,6 +130,24 @@ def main(argv = None):
 				index_of_mime_type_option = argv.index('--accept')
 				allowed_mime_types = argv[index_of_mime_type_option+1 : ]
 		
+			elif option == '--cache':
+				cache_path = value
+
+			elif option == '--tikaServer':
+				tika_server = value
+
+			elif option in ('--tikaWorkers', '--tikaTimeout'):
+				try:
+					number = int(value) if option == '--tikaWorkers' else float(value)
+				except ValueError:
+					raise _Usage(option + " needs a number, got " + value)
+				if number <= 0:
+					raise _Usage(option + " must be positive")
+				if option == '--tikaWorkers':
+					tika_workers = number
+				else:
+					tika_timeout = number
+
 			elif option in ('-v', '--verbose'):
 				global _verbose
 				_verbose = True
@@ -123,67 +165,49 @@ def main(argv = None):
 		if len(filename_list) <2 :
 			raise _Usage("you need to type in at least two valid files")
 
-		#allow only files with specifed mime types
-		if len(allowed_mime_types) != 0:
-			filename_list = [filename for filename in filename_list if parser.from_file(filename) and str(parser.from_file(filename)['metadata']['Content-Type'].encode('utf-8')).split('/')[-1] in allowed_mime_types]
-		else:
+		if len(allowed_mime_types) == 0:
 			print "Accepting all MIME Types....."
 
-		union_feature_names = set()
-		file_parsed_data = {}
-		resemblance_scores = {}
-
-		#count similarity for two given files
-		for filename in filename_list:
-			# first compute the union of all features
-			try:
-				parsedData = parser.from_file(filename)
-				filename_stripped = filename.replace(",","")
-				if parsedData:
-					file_parsed_data[filename_stripped] = parsedData["metadata"]
-					union_feature_names = union_feature_names | set(parsedData["metadata"].keys())
-			except ConnectionError:
-				sleep(1)
-			except KeyError:
-				continue
-
-		total_num_features = len(union_feature_names)
-
-
+		cache = MetadataCache(cache_path)
+		try:
+			# extract the files missing from the cache concurrently; both
+			# passes then read the metadata back from the cache
+			cache.fill(filename_list, TikaClient(tika_server, tika_workers, readTimeout=tika_timeout))
+
+			union_feature_names = set()
+			key_counts = {}
+
+			# first pass: grow the union of all features in place and keep
+			# only the number of distinct features of each file; the union
+			# contains them all, so that is also the size of their overlap
+			for filename in filename_list:
+				found, metadata = cache.get(filename)
+				if not found:
+					print >>sys.stderr, "No metadata for " + filename + ", skipped (retried on the next run)"
+					continue
+				if metadata is None:
+					continue
+				#allow only files with specifed mime types
+				if len(allowed_mime_types) != 0 and mimeSubtype(metadata) not in allowed_mime_types:
+					continue
+				union_feature_names.update(metadata)
+				key_counts[filename] = len(metadata)
 
-		# now compute the specific resemblance and containment scores
-		for filename in file_parsed_data:
-			overlap = {}
-			overlap = set(file_parsed_data[filename].keys()) & set(union_feature_names)
-			resemblance_scores[filename] = float(len(overlap))/total_num_features
+			total_num_features = len(union_feature_names)
 
-		sorted_resemblance_scores = sorted(resemblance_scores.items(), key=operator.itemgetter(1), reverse=True)
+			# second pass: score every file and write its metadata read back from the cache
+			resemblance_scores = [(filename, float(count)/total_num_features) for filename, count in key_counts.iteritems()]
+			sorted_resemblance_scores = sorted(resemblance_scores, key=operator.itemgetter(1), reverse=True)
 
-		'''print "Resemblance:\n"
-		for tuple in sorted_resemblance_scores:
-			print tuple[0]+","+str(tuple[1]) + "," + convertUnicode(file_parsed_data[tuple[0]])+'\n'''
-		with open("similarity-scores.txt", "w") as f:
-			f.write("Resemblance : \n")
-			for tuple in sorted_resemblance_scores:
-                            f.write(os.path.basename(tuple[0].rstrip(os.sep)) + ","+str(tuple[1]) + "," + tuple[0] + "," + convertUnicode(file_parsed_data[tuple[0]]) + '\n')
+			writeScores(sorted_resemblance_scores, _CachedMetadata(cache))
+		finally:
+			cache.close()
 
 	except _Usage, err:
 		print >>sys.stderr, sys.argv[0].split('/')[-1] + ': ' + str(err.msg)
 		return 2
 
 
-def convertUnicode( fileDict ) :
-	fileUTFDict = {}
-	for key in fileDict:
-		if isinstance(key, unicode) :
-			key = key.encode('utf-8').strip()
-		value = fileDict.get(key)
-		if isinstance(value, unicode) :
-			value = value.encode('utf-8').strip()
-		fileUTFDict[key] = value
-
-	return str(fileUTFDict)
-
 if __name__ == "__main__":
 	sys.exit(main())
 
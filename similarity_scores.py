@@ -0,0 +1,121 @@
+#!/usr/bin/env python2.7
+#
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+
+# Resemblance scores of similarity.py / value-similarity.py, read by
+# cluster-scores.py and circle-packing.py
+
+import os, json, ast
+
+SCORES_JSONL = "similarity-scores.jsonl"
+LEGACY_SCORES = "similarity-scores.txt"
+
+
+def writeScores(sortedScores, metadata, path=SCORES_JSONL):
+    '''
+    Write one {"name", "score", "path", "metadata"} JSON object per line
+    @param sortedScores (path, score) pairs, highest score first
+    @param metadata dict of path -> Tika metadata dict
+    '''
+    with open(path, "w") as f:
+        for filename, score in sortedScores:
+            # filenames are byte strings, kept as latin-1 so any bytes round-trip
+            f.write(json.dumps({"name": os.path.basename(filename.rstrip(os.sep)), "score": score,
+                                "path": filename, "metadata": metadata[filename]}, encoding='latin-1') + "\n")
+
+
+def parseLegacyLine(line):
+    '''
+    Entry of one line of the old "name,score,path,str(metadata dict)" text
+    format, or None for headers and malformed lines; its metadata is left as
+    the dict's text (None when missing)
+    '''
+    head, brace, metadata = line.partition("{")
+    fields = head.rstrip("\n").split(",", 3)
+    if len(fields) < 3:
+        return None
+    try:
+        score = float(fields[1])
+    except ValueError:
+        return None
+    return {"name": fields[0], "score": score, "path": fields[2].strip(),
+            "metadata": (brace + metadata).rstrip("\n") if brace else None}
+
+
+def parseLine(line):
+    if not line.strip():
+        return None
+    entry = json.loads(line)
+    entry["name"] = entry["name"].encode('latin-1')
+    entry["path"] = entry["path"].encode('latin-1')
+    return entry
+
+
+def scoresPath(path=None):
+    '''
+    path, or by default similarity-scores.jsonl, or the legacy
+    similarity-scores.txt when there is no JSON Lines file
+    '''
+    if path is None:
+        path = SCORES_JSONL if os.path.exists(SCORES_JSONL) else LEGACY_SCORES
+    return path
+
+
+def lineParser(path):
+    '''
+    Function turning one line of the score file path into an entry (or None)
+    '''
+    return parseLine if path.endswith(".jsonl") else parseLegacyLine
+
+
+def readScores(path=None):
+    '''
+    Stream the entries of a score file (see scoresPath), in file order
+    '''
+    path = scoresPath(path)
+    parse = lineParser(path)
+    with open(path) as f:
+        for line in f:
+            entry = parse(line)
+            if entry is not None:
+                yield entry
+
+
+def displayText(filename):
+    '''
+    filename as text for the visualizations: UTF-8 when it is valid UTF-8,
+    byte for byte (latin-1) otherwise
+    '''
+    try:
+        return filename.decode('utf-8')
+    except UnicodeDecodeError:
+        return filename.decode('latin-1')
+
+
+def metadataDict(entry):
+    metadata = entry["metadata"]
+    if isinstance(metadata, basestring):
+        return ast.literal_eval(metadata)
+    return metadata or {}
+
+
+def metadataText(entry):
+    metadata = entry["metadata"]
+    if metadata is None or isinstance(metadata, basestring):
+        return metadata
+    return json.dumps(metadata)
@@ -0,0 +1,159 @@
+#!/usr/bin/env python2.7
+#
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+
+# Concurrent metadata extraction against a Tika server
+
+from tika import tika
+from requests import Session, ConnectionError, Timeout
+from requests.adapters import HTTPAdapter
+from multiprocessing.pool import ThreadPool
+from time import sleep
+import sys
+
+def mergeMetadata(documents):
+    '''
+    One metadata dict for the /rmeta documents of a file (the file itself
+    followed by its embedded documents), merged the way tika-python's
+    parser.from_file merges them: a key seen in several documents maps to
+    the list of its values. Extracted text is dropped.
+    '''
+    metadata = {}
+    for document in documents:
+        for key, value in document.iteritems():
+            if key == "X-TIKA:content":
+                continue
+            if key not in metadata:
+                metadata[key] = value
+            else:
+                if not isinstance(metadata[key], list):
+                    metadata[key] = [metadata[key]]
+                metadata[key].append(value)
+    return metadata
+
+
+class TikaClient:
+    '''
+    Extracts metadata over one pooled keep-alive HTTP session.
+
+    Connection failures and busy-server responses are retried with
+    exponential backoff; once the retries are exhausted the error is
+    raised instead of the file being dropped. A request that cannot connect
+    within connectTimeout or gets no response for readTimeout seconds
+    counts as a connection failure.
+
+    Any other failure returns None. It is final (see extract) when Tika
+    rejected the file itself with a 4xx status, e.g. 415 for an unsupported
+    type or 422 for a file it cannot parse.
+    '''
+    retryStatus = (429, 502, 503, 504)
+    transientStatus = (408, 429)
+
+    def __init__(self, serverEndpoint=None, workers=4, retries=5, backoff=0.5, connectTimeout=10, readTimeout=300):
+        '''
+        @param serverEndpoint Tika server URL (default: start/reuse the local
+               server the same way tika-python does)
+        @param workers size of the thread pool and of the connection pool
+        @param readTimeout seconds to wait for Tika to answer a request
+        '''
+        if workers < 1:
+            raise ValueError("workers must be at least 1, got " + str(workers))
+        self.serverEndpoint = serverEndpoint
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = (connectTimeout, readTimeout)
+
+        self.session = Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+
+    def endpoint(self):
+        '''
+        Server URL; the local server is only checked/started on first use,
+        so fully cached runs never touch Tika
+        '''
+        if self.serverEndpoint is None:
+            tika.checkTikaServer()
+            self.serverEndpoint = tika.ServerEndpoint
+        return self.serverEndpoint.rstrip('/')
+
+
+    def metadata(self, filename):
+        '''
+        Metadata dict of filename, with the same contents as
+        parser.from_file(filename)["metadata"], or None when Tika cannot
+        parse it
+        '''
+        return self.extract(filename)[0]
+
+
+    def extract(self, filename):
+        '''
+        Return (metadata, final): metadata as for metadata(), and whether
+        asking again would give the same answer, i.e. whether it may be cached
+        '''
+        url = self.endpoint() + "/rmeta/text"
+        for attempt in range(self.retries + 1):
+            try:
+                with open(filename, "rb") as f:
+                    response = self.session.put(url, data=f,
+                                                headers={"Accept": "application/json"},
+                                                timeout=self.timeout)
+                if response.status_code not in self.retryStatus:
+                    break
+                error = "HTTP " + str(response.status_code)
+            except (ConnectionError, Timeout), error:
+                if attempt == self.retries:
+                    raise
+
+            if attempt < self.retries:
+                sleep(self.backoff * 2 ** attempt)
+        else:
+            raise ConnectionError("Tika server kept failing on " + filename + ": " + str(error))
+
+        status = response.status_code
+        if status != 200:
+            print >>sys.stderr, "Tika could not parse " + filename + " (HTTP " + str(status) + ")"
+            return None, 400 <= status < 500 and status not in self.transientStatus
+
+        if not response.content:
+            print >>sys.stderr, "Tika sent an empty response for " + filename
+            return None, False
+        return mergeMetadata(response.json()), True
+
+
+    def extractAll(self, filenames):
+        '''
+        Yield (filename, metadata, final) for every file (see extract), extracted concurrently
+        by at most self.workers threads; results arrive in completion order
+        '''
+        self.endpoint()
+        pool = ThreadPool(self.workers)
+        try:
+            for result in pool.imap_unordered(self._extract, filenames):
+                yield result
+        finally:
+            pool.terminate()
+
+
+    def _extract(self, filename):
+        metadata, final = self.extract(filename)
+        return filename, metadata, final
@@ -26,6 +26,7 @@ import getopt
 import json
 import operator
 from time import sleep
+from similarity_scores import writeScores
 from requests import ConnectionError
 
 _verbose = False
@@ -139,9 +140,8 @@ def main(argv = None):
 			file_parsed = []
 			# first compute the union of all features
 			parsedData = parser.from_file(filename)
-			filename_stripped = filename.replace(",", "")
 			try:
-				file_metadata[filename_stripped] = parsedData["metadata"]
+				file_metadata[filename] = parsedData["metadata"]
 
 				#get key : value of metadata
 				for key in parsedData["metadata"]:
@@ -151,8 +151,8 @@ def main(argv = None):
 
 					file_parsed.append(str(key.strip(' ').encode('utf-8') + ": " + value.strip(' ').encode('utf-8')))
 
-				file_parsed_data[filename_stripped] = set(file_parsed)
-				union_feature_names = union_feature_names | set(file_parsed_data[filename_stripped])
+				file_parsed_data[filename] = set(file_parsed)
+				union_feature_names = union_feature_names | set(file_parsed_data[filename])
 
 			except ConnectionError:
 				sleep(1)
@@ -174,27 +174,12 @@ def main(argv = None):
 		'''print "Resemblance:\n"
 		for tuple in sorted_resemblance_scores:
 			print os.path.basename(tuple[0].rstrip(os.sep))+","+str(tuple[1]) +"," + tuple[0] + ","+ convertUnicode(file_metadata[tuple[0]])+'\n'''
-		with open("similarity-scores.txt", "w") as f:
-			f.write("Resemblance : \n")
-			for tuple in sorted_resemblance_scores:
-				f.write(os.path.basename(tuple[0].rstrip(os.sep))+","+str(tuple[1]) +"," + tuple[0] + ","+ convertUnicode(file_metadata[tuple[0]])+'\n')
+		writeScores(sorted_resemblance_scores, file_metadata)
 
 	except _Usage, err:
 		print >>sys.stderr, sys.argv[0].split('/')[-1] + ': ' + str(err.msg)
 		return 2
 
-def convertUnicode( fileDict ) :
-	fileUTFDict = {}
-	for key in fileDict:
-		if isinstance(key, unicode) :
-			key = key.encode('utf-8').strip()
-		value = fileDict.get(key)
-		if isinstance(value, unicode) :
-			value = value.encode('utf-8').strip()
-		fileUTFDict[key] = value
-
-	return str(fileUTFDict)
-
 if __name__ == "__main__":
 	sys.exit(main())
 
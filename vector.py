@@ -37,6 +37,7 @@ class Vector:
         @param metadata features 
         '''
         self.features = {}
+        self.magnitude = None
         
         if filename and features:
             self.filename = filename
@@ -59,10 +60,15 @@ class Vector:
     '''
 
     def getMagnitude(self):
-        totalMagnitude = 0.0
-        for key in self.features:
-            totalMagnitude += self.features[key] ** 2
-        return math.sqrt(totalMagnitude)
+        '''
+        Computed once; features must not be modified after the first call
+        '''
+        if self.magnitude is None:
+            totalMagnitude = 0.0
+            for key in self.features:
+                totalMagnitude += self.features[key] ** 2
+            self.magnitude = math.sqrt(totalMagnitude)
+        return self.magnitude
 
 
     def dotProduct(self, anotherVector):
@@ -72,10 +78,13 @@ class Vector:
         A.B = a*m + b*n + c*o
         '''        
         dot_product = 0.0
-        intersect_features = set(self.features) & set(anotherVector.features)
-        
-        for feature in intersect_features:
-            dot_product += self.features[feature] * anotherVector.features[feature]
+        features1, features2 = self.features, anotherVector.features
+        if len(features1) > len(features2):
+            features1, features2 = features2, features1
+
+        for feature, value in features1.iteritems():
+            if feature in features2:
+                dot_product += value * features2[feature]
         return dot_product
 
 
@@ -90,19 +99,16 @@ class Vector:
     def euclidean_dist(self, anotherVector):
         '''
         dist = ((x1-x2)^2 + (y1-y2)^2 + (z1-z2)^2)^(0.5)
+        features missing from one vector count as 0 in it
         '''
-        intersect_features = set(self.features) & set(anotherVector.features)
+        features1, features2 = self.features, anotherVector.features
 
         dist_sum = 0.0
-        for feature in intersect_features:
-            dist_sum += (self.features[feature] - anotherVector.features[feature]) ** 2
-
-        setA = set(self.features) - intersect_features
-        for feature in setA:
-            dist_sum += self.features[feature] ** 2
+        for feature, value in features1.iteritems():
+            dist_sum += (value - features2.get(feature, 0)) ** 2
 
-        setB = set(anotherVector.features) - intersect_features
-        for feature in setB:
-            dist_sum += anotherVector.features[feature] ** 2
+        for feature, value in features2.iteritems():
+            if feature not in features1:
+                dist_sum += value ** 2
 
         return math.sqrt(dist_sum)
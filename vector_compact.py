@@ -0,0 +1,187 @@
+#!/usr/bin/env python2.7
+#
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+
+# Array-backed drop-in for vector_ext.Vector on large corpora
+
+from vector_ext import stringify
+from edit_distance import valueDistances
+from array import array
+import math
+
+class InternTable:
+    '''
+    Maps each distinct string to a dense int id, storing it only once
+    '''
+
+    def __init__(self):
+        self.ids = {}
+        self.strings = []
+
+    def intern(self, string):
+        stringId = self.ids.get(string)
+        if stringId is None:
+            stringId = self.ids[string] = len(self.strings)
+            self.strings.append(string)
+        return stringId
+
+    def __getitem__(self, stringId):
+        return self.strings[stringId]
+
+    def __len__(self):
+        return len(self.strings)
+
+
+class CompactVector(object):
+    '''
+    Same features and distance APIs as vector_ext.Vector, stored as a sorted
+    int32 feature-id array with parallel float32 lengths and int32 ids of
+    the text values. Feature names and texts live once in class-wide
+    intern tables shared by every document.
+    '''
+    __slots__ = ('filename', 'ids', 'values', 'textIds', 'magnitude', 'index')
+
+    na_metadata = ["resourceName"]
+    vocabulary = InternTable()
+    texts = InternTable()
+
+    def __init__(self, filename=None, features=None):
+        '''
+        Create a vector
+        @param metadata features
+        '''
+        self.filename = filename
+        entries = []
+        if filename and features:
+            for key in features:
+                if key in self.na_metadata:
+                    continue
+                text = stringify(features[key])
+                entries.append((self.vocabulary.intern(key), len(text), self.texts.intern(text)))
+        entries.sort()
+
+        self.ids = array('i', [entry[0] for entry in entries])
+        self.values = array('f', [entry[1] for entry in entries])
+        self.textIds = array('i', [entry[2] for entry in entries])
+        self.magnitude = math.sqrt(sum(value * value for value in self.values))
+
+    @property
+    def features(self):
+        return dict((self.vocabulary[featureId], value) for featureId, value in zip(self.ids, self.values))
+
+    @property
+    def featuresText(self):
+        return dict((self.vocabulary[featureId], self.texts[textId]) for featureId, textId in zip(self.ids, self.textIds))
+
+    @property
+    def featureSet(self):
+        return frozenset(self.vocabulary[featureId] for featureId in self.ids)
+
+    def getMagnitude(self):
+        return self.magnitude
+
+
+    def sharedFeatures(self, anotherVector):
+        '''
+        Yield (i, j) positions of the feature ids both vectors have,
+        by merging the two sorted id arrays
+        '''
+        ids1, ids2 = self.ids, anotherVector.ids
+        i, j = 0, 0
+        len1, len2 = len(ids1), len(ids2)
+        while i < len1 and j < len2:
+            if ids1[i] == ids2[j]:
+                yield i, j
+                i += 1
+                j += 1
+            elif ids1[i] < ids2[j]:
+                i += 1
+            else:
+                j += 1
+
+
+    def dotProduct(self, anotherVector):
+        '''
+        A = ax+by+cz
+        B = mx+ny+oz
+        A.B = a*m + b*n + c*o
+        '''
+        values1, values2 = self.values, anotherVector.values
+        dot_product = 0.0
+        for i, j in self.sharedFeatures(anotherVector):
+            dot_product += values1[i] * values2[j]
+        return dot_product
+
+
+    def cosTheta(self, v2):
+        '''
+        cosTheta = (V1.V2) / (|V1| |V2|)
+        cos 0 = 1 implies identical documents
+        '''
+        div = self.magnitude * v2.magnitude
+
+        if (div == 0):
+            return 0
+
+        return self.dotProduct(v2) / div
+
+    def cosine_dist(self, v2):
+        return 1 - self.cosTheta(v2)
+
+    def euclidean_dist(self, anotherVector):
+        '''
+        dist = ((x1-x2)^2 + (y1-y2)^2 + (z1-z2)^2)^(0.5)
+        features missing from one vector count as 0 in it
+        '''
+        values1, values2 = self.values, anotherVector.values
+        dist_sum = self.magnitude ** 2 + anotherVector.magnitude ** 2
+        for i, j in self.sharedFeatures(anotherVector):
+            dist_sum -= 2 * values1[i] * values2[j]
+        return math.sqrt(max(dist_sum, 0.0))
+
+    def edit_dist(self, anotherVector):
+        file_edit_distance = 0.0
+        count = 0
+        for i, j in self.sharedFeatures(anotherVector):
+            if self.values[i] == 0 and anotherVector.values[j] == 0:
+                continue
+
+            file_edit_distance += valueDistances.normalizedDistance(self.texts[self.textIds[i]], self.texts[anotherVector.textIds[j]])
+            count += 1
+
+        if count == 0:
+            return file_edit_distance
+
+        file_edit_distance /= count
+        return file_edit_distance
+
+    def jaccard_sim(self, anotherVector):
+        intersectNum = sum(1 for shared in self.sharedFeatures(anotherVector))
+        unionNum = len(self.ids) + len(anotherVector.ids) - intersectNum
+        return float(intersectNum) / float(unionNum)
+
+    def jaccard_dist(self, anotherVector):
+        return 1 - self.jaccard_sim(anotherVector)
+
+
+    def printFeatures(self):
+        print "["
+        print "filename : " , self.filename
+        for key, value in self.features.iteritems():
+            print key, " : " , value
+        print "]"
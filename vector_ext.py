@@ -17,7 +17,8 @@
 #
 #
 
-import math, editdistance
+from edit_distance import valueDistances
+import math
 
 def stringify(attribute_value):
     if isinstance(attribute_value, list):
@@ -44,7 +45,15 @@ class Vector:
         if filename and features:
             self.filename = filename
             self.prepareFeatures(features)
-            self.featureSet = frozenset(self.features.keys())
+        self.freeze()
+
+    def freeze(self):
+        '''
+        Cache the key set and norm used by every distance;
+        features must not be modified afterwards
+        '''
+        self.featureSet = frozenset(self.features.keys())
+        self.magnitude = math.sqrt(sum(value ** 2 for value in self.features.itervalues()))
     
     def prepareFeatures(self, features):
         for na in self.na_metadata:
@@ -64,10 +73,7 @@ class Vector:
     '''
 
     def getMagnitude(self):
-        totalMagnitude = 0.0
-        for key in self.features:
-            totalMagnitude += self.features[key] ** 2
-        return math.sqrt(totalMagnitude)
+        return self.magnitude
 
 
     def dotProduct(self, anotherVector):
@@ -77,10 +83,9 @@ class Vector:
         A.B = a*m + b*n + c*o
         '''        
         dot_product = 0.0
-        intersect_features = set(self.features) & set(anotherVector.features)
-        
-        for feature in intersect_features:
-            dot_product += self.features[feature] * anotherVector.features[feature]
+        features1, features2 = self.features, anotherVector.features
+        for feature in self.featureSet & anotherVector.featureSet:
+            dot_product += features1[feature] * features2[feature]
         return dot_product
 
 
@@ -89,7 +94,7 @@ class Vector:
         cosTheta = (V1.V2) / (|V1| |V2|)
         cos 0 = 1 implies identical documents
         '''
-        div = (self.getMagnitude() * v2.getMagnitude())
+        div = (self.magnitude * v2.magnitude)
         
         if (div == 0):
             return 0
@@ -102,22 +107,10 @@ class Vector:
     def euclidean_dist(self, anotherVector):
         '''
         dist = ((x1-x2)^2 + (y1-y2)^2 + (z1-z2)^2)^(0.5)
+             = (|V1|^2 + |V2|^2 - 2 V1.V2)^(0.5)
         '''
-        intersect_features = set(self.features) & set(anotherVector.features)
-
-        dist_sum = 0.0
-        for feature in intersect_features:
-            dist_sum += (self.features[feature] - anotherVector.features[feature]) ** 2
-
-        setA = set(self.features) - intersect_features
-        for feature in setA:
-            dist_sum += self.features[feature] ** 2
-
-        setB = set(anotherVector.features) - intersect_features
-        for feature in setB:
-            dist_sum += anotherVector.features[feature] ** 2
-
-        return math.sqrt(dist_sum)
+        dist_sum = self.magnitude ** 2 + anotherVector.magnitude ** 2 - 2 * self.dotProduct(anotherVector)
+        return math.sqrt(max(dist_sum, 0.0))
     
     def edit_dist(self, anotherVector):
 #         intersect_features = set(self.features.keys()) & set(anotherVector.features.keys())
@@ -135,7 +128,7 @@ class Vector:
             if divider == 0:
                 continue
             
-            feature_distance = float(editdistance.eval(file1_feature_value, file2_feature_value))/ divider
+            feature_distance = valueDistances.normalizedDistance(file1_feature_value, file2_feature_value)
             file_edit_distance += feature_distance
             count += 1
         